@@ -1,157 +1,190 @@
 import csv
 import pickle
 import os
+from array import array
+from bisect import bisect_left, bisect_right
+
+DEFAULT_T = 64  # grado mínimo: cada nodo guarda hasta 2t - 1 claves
+
+
+def _typecode(key):
+    """Tipo de array para claves numéricas (como price); None si van en una lista."""
+    if isinstance(key, (int, float)) and not isinstance(key, bool):
+        return "d"
+    return None
+
 
 class BPlusTreeNode:
-    def __init__(self, is_leaf=False):
+    """Nodo con claves y valores en arreglos paralelos, buscados con bisect.
+
+    Hojas: values[i] es el valor de keys[i] (una entrada por valor si la clave
+    se repite). Internos: children[i] cubre las claves entre keys[i - 1] y keys[i].
+    Con claves numéricas keys es un array("d") en vez de una lista de objetos.
+    """
+
+    __slots__ = ("is_leaf", "keys", "values", "children", "next")
+
+    def __init__(self, is_leaf=False, keys=None):
         self.is_leaf = is_leaf
-        self.keys = []
+        self.keys = keys if keys is not None else []
+        self.values = []
         self.children = []
         self.next = None  # for leaf linkage
 
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        if "values" not in state:
+            # Formato anterior: las hojas guardaban children = [(clave, valor), ...]
+            state = dict(state)
+            if state["is_leaf"]:
+                pairs = state["children"]
+                state["keys"] = [k for k, _ in pairs]
+                state["values"] = [v for _, v in pairs]
+                state["children"] = []
+            else:
+                state["values"] = []
+        state.setdefault("next", None)
+        for name in self.__slots__:
+            setattr(self, name, state[name])
+
+
 class BPlusTree:
-    def __init__(self, t=3):
+    """Árbol B+ en memoria que se guarda completo con pickle.
+
+    Los índices bplustree de las tablas usan PagedBPlusTree; esta clase queda
+    para abrir los índices pickle del formato anterior (load_bplus_tree) y para
+    bplustree_manager.py.
+    """
+
+    def __init__(self, t=DEFAULT_T):
+        self.t = max(int(t), 2)
+        self.typecode = None  # se decide con la primera clave
         self.root = BPlusTreeNode(is_leaf=True)
-        self.t = t
 
-    def search(self, key):
+    def __setstate__(self, state):
+        # Árboles guardados antes de las claves tipadas
+        state.setdefault("typecode", None)
+        self.__dict__.update(state)
+
+    def _new_node(self, is_leaf=False):
+        keys = array(self.typecode) if self.typecode else []
+        return BPlusTreeNode(is_leaf, keys)
+
+    def _find_leaf(self, key):
+        """Primera hoja que puede contener key."""
         node = self.root
         while not node.is_leaf:
-            i = self._find_index(node.keys, key)
-            node = node.children[i]
-        return [record for k, record in node.children if k == key]
+            node = node.children[bisect_left(node.keys, key)]
+        return node
 
-    def range_search(self, start_key, end_key):
-        
-        print("start_key",start_key, type(start_key))
-        print("end_key",end_key, type(end_key))
-        
+    def _leftmost_leaf(self):
         node = self.root
         while not node.is_leaf:
-            i = self._find_index(node.keys, start_key)
-            node = node.children[i]
-        result = []
+            node = node.children[0]
+        return node
+
+    def search(self, key):
+        return [record for _, record in self._cursor_forward(key, key)]
+
+    def range_search(self, start_key, end_key):
+        return [record for _, record in self.cursor(start_key, end_key)]
+
+    def cursor(self, start_key=None, end_key=None, descending=False, limit=None):
+        """Generador de (clave, registro) en el rango; se detiene tras limit resultados."""
+        if descending:
+            # Las hojas solo están enlazadas hacia adelante: se junta el rango y se invierte
+            entries = reversed(list(self.cursor(start_key, end_key)))
+        else:
+            entries = self._cursor_forward(start_key, end_key)
+        for n, entry in enumerate(entries):
+            if limit is not None and n >= limit:
+                return
+            yield entry
+
+    def _cursor_forward(self, start_key, end_key):
+        if start_key is None:
+            node, i = self._leftmost_leaf(), 0
+        else:
+            node = self._find_leaf(start_key)
+            i = bisect_left(node.keys, start_key)
         while node:
-            for k, record in node.children:
-                print("k",k, type(k))
-                print("record",record)
-                if start_key <= k <= end_key:
-                    result.append(record)
-                elif k > end_key:
-                    return result
-            node = node.next
-        return result
+            keys = node.keys
+            end = len(keys) if end_key is None else bisect_right(keys, end_key)
+            yield from zip(keys[i:end], node.values[i:end])
+            if end < len(keys):
+                return
+            node, i = node.next, 0
 
     def add(self, key, value):
         root = self.root
+        if root.is_leaf and not root.keys and self.typecode is None:
+            self.typecode = _typecode(key)
+            root.keys = self._new_node().keys
         if len(root.keys) == (2 * self.t - 1):
-            new_root = BPlusTreeNode()
-            new_root.children.append(self.root)
+            new_root = self._new_node()
+            new_root.children.append(root)
             self._split_child(new_root, 0)
             self.root = new_root
-            
+
         self._insert_non_full(self.root, key, value)
 
-    def remove(self, key):
-        self._remove_recursive(self.root, key)
-        if not self.root.keys and not self.root.is_leaf:
-            self.root = self.root.children[0]
+    def remove(self, key, value=None):
+        """Elimina las entradas con clave key (solo las de ese valor si se indica).
 
-    def _remove_recursive(self, node, key):
-        t = self.t
-        if node.is_leaf:
-            node.children = [(k, v) for (k, v) in node.children if k != key]
-            node.keys = [k for (k, _) in node.children]
-        else:
-            idx = self._find_index(node.keys, key)
-            child = node.children[idx]
-            self._remove_recursive(child, key)
-            if len(child.keys) < t - 1:
-                left_sibling = node.children[idx - 1] if idx > 0 else None
-                right_sibling = node.children[idx + 1] if idx + 1 < len(node.children) else None
-
-                if left_sibling and len(left_sibling.keys) > t - 1:
-                    borrow_key = left_sibling.keys.pop()
-                    borrow_child = left_sibling.children.pop()
-                    child.keys.insert(0, node.keys[idx - 1])
-                    child.children.insert(0, borrow_child)
-                    node.keys[idx - 1] = borrow_key
-
-                elif right_sibling and len(right_sibling.keys) > t - 1:
-                    borrow_key = right_sibling.keys.pop(0)
-                    borrow_child = right_sibling.children.pop(0)
-                    child.keys.append(node.keys[idx])
-                    child.children.append(borrow_child)
-                    node.keys[idx] = borrow_key
-
-                elif left_sibling:
-                    left_sibling.keys += [node.keys[idx - 1]] + child.keys
-                    left_sibling.children += child.children
-                    if child.is_leaf:
-                        left_sibling.next = child.next
-                    node.keys.pop(idx - 1)
-                    node.children.pop(idx)
-
-                elif right_sibling:
-                    child.keys += [node.keys[idx]] + right_sibling.keys
-                    child.children += right_sibling.children
-                    if right_sibling.is_leaf:
-                        child.next = right_sibling.next
-                    node.keys.pop(idx)
-                    node.children.pop(idx + 1)
+        Las hojas que quedan con pocas claves no se fusionan: los recorridos
+        siguen el enlace next, así que una hoja vacía solo ocupa memoria.
+        """
+        node = self._find_leaf(key)
+        while node:
+            keys = node.keys
+            lo, hi = bisect_left(keys, key), bisect_right(keys, key)
+            last = hi < len(keys)
+            for i in reversed(range(lo, hi)):
+                if value is None or node.values[i] == value:
+                    del keys[i]
+                    del node.values[i]
+            if last:
+                return
+            node = node.next
 
     def _insert_non_full(self, node, key, value):
-        if node.is_leaf:
-            i = self._find_index([k for k, _ in node.children], key)
-            node.children.insert(i, (key, value))
-            #node.children.insert(i, (key, value))
-        else:
-            i = self._find_index(node.keys, key)
-            # Verificar si el hijo está lleno según si es hoja o interno
-            child = node.children[i]
-            is_full = (
-                len(child.children) == (2 * self.t - 1)
-                if child.is_leaf else
-                len(child.keys) == (2 * self.t - 1)
-            )
-
-            if is_full:
+        # Los nodos llenos se dividen al bajar: la hoja destino siempre tiene lugar
+        while not node.is_leaf:
+            i = bisect_right(node.keys, key)
+            if len(node.children[i].keys) == (2 * self.t - 1):
                 self._split_child(node, i)
-                if key > node.keys[i]:
+                if key >= node.keys[i]:
                     i += 1
-
-            self._insert_non_full(node.children[i], key, value)
+            node = node.children[i]
+        i = bisect_right(node.keys, key)
+        node.keys.insert(i, key)
+        node.values.insert(i, value)
 
     def _split_child(self, parent, index):
         t = self.t
         child = parent.children[index]
-        new_child = BPlusTreeNode(is_leaf=child.is_leaf)
-
-        #parent.keys.insert(index, child.keys[t - 1])
-        parent.children.insert(index + 1, new_child)
-
-        #new_child.keys = child.keys[t:]
-        #child.keys = child.keys[:t - 1]
+        new_child = self._new_node(is_leaf=child.is_leaf)
 
         if child.is_leaf:
-            new_child.children = child.children[t:]
-            child.children = child.children[:t]
+            new_child.keys = child.keys[t:]
+            new_child.values = child.values[t:]
+            del child.keys[t:]
+            del child.values[t:]
             new_child.next = child.next
             child.next = new_child
-            parent.keys.insert(index, new_child.children[0][0])
+            separator = new_child.keys[0]
         else:
+            separator = child.keys[t - 1]
             new_child.keys = child.keys[t:]
-            child.keys = child.keys[:t - 1]
             new_child.children = child.children[t:]
-            child.children = child.children[:t]
-            parent.keys.insert(index, child.keys[t - 1])
-
-    def _find_index(self, keys, key):
-        for i, item in enumerate(keys):
-            if key < item:
-                return i
-        return len(keys)
-    
+            del child.keys[t - 1:]
+            del child.children[t:]
+
+        parent.keys.insert(index, separator)
+        parent.children.insert(index + 1, new_child)
+
     def save_to_file(self, filename):
         with open(filename, 'wb') as f:
             pickle.dump(self, f)
@@ -9,5 +9,5 @@ bplustree_path = "tables/bplustree_precio.dat"
 if os.path.exists(bplustree_path):
   bplus_tree = BPlusTree.load_from_file(bplustree_path)
 else:
-  bplus_tree = BPlusTree(t=3)
+  bplus_tree = BPlusTree()
   bplus_tree.save_to_file(bplustree_path)
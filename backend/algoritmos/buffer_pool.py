@@ -0,0 +1,228 @@
+import os
+import threading
+from collections import OrderedDict
+
+from algoritmos.mapped_file import MappedFile
+
+PAGE_SIZE = 4096  # bytes por página de disco
+DEFAULT_POOL_PAGES = 1024  # capacidad por defecto del buffer pool (4 MiB)
+
+
+def _pages(offset, size):
+    """Números de página que cubre el rango [offset, offset + size)."""
+    if size <= 0:
+        return range(0)
+    return range(offset // PAGE_SIZE, (offset + size - 1) // PAGE_SIZE + 1)
+
+
+class BufferPool:
+    """Buffer pool LRU de páginas de tamaño fijo compartido por tablas e índices.
+
+    Las páginas se identifican por (archivo, número de página). Cada acceso se
+    cuenta en stats[owner] (owner = tabla o índice que hace la lectura):
+      - "reads":  páginas leídas de disco (fallos del pool)
+      - "writes": páginas escritas a disco
+      - "hits":   páginas servidas desde memoria
+    Las escrituras son write-through: van al archivo y actualizan la copia en
+    el pool si la página está cargada.
+    """
+
+    def __init__(self, capacity=DEFAULT_POOL_PAGES):
+        self.capacity = max(int(capacity), 1)
+        self.pages = OrderedDict()
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _count(self, owner, kind, n=1):
+        counters = self.stats.setdefault(owner, {"reads": 0, "writes": 0, "hits": 0})
+        counters[kind] += n
+
+    def resize(self, capacity):
+        with self._lock:
+            self.capacity = max(int(capacity), 1)
+            while len(self.pages) > self.capacity:
+                self.pages.popitem(last=False)
+
+    def get(self, owner, path, page_no, load):
+        """Página page_no de path; load(page_no) la lee de disco si no está cargada."""
+        key = (path, page_no)
+        with self._lock:
+            page = self.pages.get(key)
+            if page is not None:
+                self.pages.move_to_end(key)
+                self._count(owner, "hits")
+                return page
+        page = load(page_no)
+        with self._lock:
+            self._count(owner, "reads")
+            self.pages[key] = page
+            if len(self.pages) > self.capacity:
+                self.pages.popitem(last=False)
+        return page
+
+    def patch(self, owner, path, offset, data):
+        """Refleja en las páginas cargadas una escritura ya hecha en disco."""
+        with self._lock:
+            for page_no in _pages(offset, len(data)):
+                self._count(owner, "writes")
+                key = (path, page_no)
+                page = self.pages.get(key)
+                if page is None:
+                    continue
+                start = page_no * PAGE_SIZE
+                lo = max(offset, start)
+                hi = min(offset + len(data), start + PAGE_SIZE)
+                buf = bytearray(page)
+                if len(buf) < hi - start:
+                    buf.extend(bytes(hi - start - len(buf)))
+                buf[lo - start : hi - start] = data[lo - offset : hi - offset]
+                self.pages[key] = bytes(buf)
+
+    def count(self, owner, reads=0, writes=0):
+        """Registra accesos hechos fuera del pool (recorridos y escrituras masivas)."""
+        with self._lock:
+            self._count(owner, "reads", reads)
+            self._count(owner, "writes", writes)
+
+    def discard(self, path):
+        """Descarta las páginas de un archivo que fue reemplazado o truncado."""
+        with self._lock:
+            for key in [key for key in self.pages if key[0] == path]:
+                del self.pages[key]
+
+    def snapshot(self):
+        with self._lock:
+            return {owner: dict(counters) for owner, counters in self.stats.items()}
+
+    def diff(self, before):
+        """Accesos hechos desde el snapshot before, por owner y en total."""
+        total = {"reads": 0, "writes": 0, "hits": 0}
+        by_owner = {}
+        for owner, counters in self.snapshot().items():
+            prev = before.get(owner, {})
+            delta = {kind: n - prev.get(kind, 0) for kind, n in counters.items()}
+            if any(delta.values()):
+                by_owner[owner] = delta
+                for kind, n in delta.items():
+                    total[kind] += n
+        return {**total, "by_owner": by_owner}
+
+
+buffer_pool = BufferPool(int(os.environ.get("BUFFER_POOL_PAGES", DEFAULT_POOL_PAGES)))
+
+
+def count_pages(nbytes):
+    return -(-int(nbytes) // PAGE_SIZE)
+
+
+class _PageStream:
+    """Lectura secuencial (tipo archivo) desde un offset, página a página por el pool.
+
+    Sirve para lecturas que cruzan páginas y para pickle.load sobre registros
+    de tamaño variable.
+    """
+
+    def __init__(self, paged_file, offset):
+        self.paged_file = paged_file
+        self.pos = offset
+
+    def _chunk(self):
+        page_no, start = divmod(self.pos, PAGE_SIZE)
+        return self.paged_file.page(page_no)[start:]
+
+    def read(self, n=-1):
+        parts = []
+        while n != 0:
+            chunk = self._chunk()
+            if not chunk:
+                break
+            if n > 0:
+                chunk = chunk[:n]
+                n -= len(chunk)
+            parts.append(chunk)
+            self.pos += len(chunk)
+        return b"".join(parts)
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[: len(data)] = data
+        return len(data)
+
+    def readline(self):
+        parts = []
+        while True:
+            chunk = self._chunk()
+            if not chunk:
+                break
+            end = chunk.find(b"\n")
+            if end >= 0:
+                chunk = chunk[: end + 1]
+            parts.append(chunk)
+            self.pos += len(chunk)
+            if end >= 0:
+                break
+        return b"".join(parts)
+
+
+class PagedFile(MappedFile):
+    """Archivo de registros cuyas lecturas puntuales pasan por el buffer pool.
+
+    Mantiene la interfaz de MappedFile (record, read, records, len). Las
+    lecturas por slot/offset se sirven desde páginas del pool; los recorridos
+    completos (records) leen directo del mapeo para no desalojar el pool, pero
+    sus páginas se cuentan igual como lecturas de disco.
+    """
+
+    def __init__(self, path, record_size, owner, pool=None):
+        super().__init__(path, record_size)
+        self.owner = owner
+        self.pool = pool or buffer_pool
+
+    def invalidate(self):
+        super().invalidate()
+        self.pool.discard(self.path)
+
+    def _load_page(self, page_no):
+        start = page_no * PAGE_SIZE
+        return bytes(self.view[start : start + PAGE_SIZE])
+
+    def page(self, page_no):
+        return self.pool.get(self.owner, self.path, page_no, self._load_page)
+
+    def read(self, offset, size):
+        if offset < 0 or offset + size > len(self.view):
+            return None
+        page_no, start = divmod(offset, PAGE_SIZE)
+        if start + size <= PAGE_SIZE:
+            return self.page(page_no)[start : start + size]
+        return _PageStream(self, offset).read(size)
+
+    def stream(self, offset):
+        return _PageStream(self, offset)
+
+    def records(self):
+        self.pool.count(self.owner, reads=count_pages(len(self.view)))
+        return super().records()
+
+    def write(self, offset, data):
+        """Escribe data en el offset dado (en el lugar)."""
+        with open(self.path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+        if self._view is None or offset + len(data) > len(self._view):
+            self._stale = True  # el archivo creció más allá del mapeo
+        self.pool.patch(self.owner, self.path, offset, data)
+
+    def append(self, data):
+        """Agrega data al final del archivo y devuelve el offset donde quedó."""
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        self._stale = True  # el mapeo no cubre los bytes nuevos
+        self.pool.patch(self.owner, self.path, offset, data)
+        return offset
+
+    def rewritten(self, nbytes):
+        """El archivo fue reescrito por fuera (carga masiva, reorganize)."""
+        self.invalidate()
+        self.pool.count(self.owner, writes=count_pages(nbytes))
@@ -4,7 +4,6 @@ import hashlib
 import csv
 
 DATA_DIR = "extendible_hashing_data"
-os.makedirs(DATA_DIR, exist_ok=True)  # Crear la carpeta si no existe
 
 class Bucket:
     def __init__(self, size=4):
@@ -18,9 +17,13 @@ class Bucket:
     def add(self, key, value):
         self.records.append((key, value))
 
-    def remove(self, key):
+    def remove(self, key, value=None):
         original = len(self.records)
-        self.records = [(k, v) for (k, v) in self.records if k != key]
+        self.records = [
+            (k, v)
+            for (k, v) in self.records
+            if k != key or (value is not None and v != value)
+        ]
         return len(self.records) < original
 
     def search(self, key):
@@ -30,14 +33,23 @@ class Bucket:
         return [v for k, v in self.records if k1 <= k <= k2]
 
 class ExtendibleHashing:
-    def __init__(self, bucket_size=4, dir_file="directory.dat"):
+    def __init__(self, bucket_size=4, dir_file="directory.dat", data_dir=DATA_DIR):
         self.bucket_size = bucket_size
-        self.directory_file = os.path.join(DATA_DIR, dir_file)
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)  # Crear la carpeta si no existe
+        self.directory_file = os.path.join(data_dir, dir_file)
         self.global_depth = 1
+        # Cambios pendientes hasta el próximo flush (checkpoint del WAL):
+        # buckets modificados, si cambió el directorio y buckets a borrar
+        self._dirty = {}
+        self._directory_dirty = False
+        self._removed = set()
 
         if os.path.exists(self.directory_file):
             with open(self.directory_file, "rb") as f:
                 self.directory = pickle.load(f)
+            # La profundidad global es el largo de las entradas del directorio
+            self.global_depth = len(next(iter(self.directory)))
         else:
             self.directory = {"0": self._bucket_path("bucket_0.dat"), 
                               "1": self._bucket_path("bucket_1.dat")}
@@ -46,16 +58,45 @@ class ExtendibleHashing:
             self._save_directory()
 
     def _bucket_path(self, filename):
-        return os.path.join(DATA_DIR, filename)
+        return os.path.join(self.data_dir, filename)
 
     def _hash(self, key):
+        # Bits menos significativos: al duplicar el directorio se antepone un bit
         h = hashlib.md5(str(key).encode()).hexdigest()
-        return bin(int(h, 16))[2:].zfill(128)[:self.global_depth]
+        return bin(int(h, 16))[2:].zfill(128)[-self.global_depth:]
 
     def _load_bucket(self, filename):
+        if filename in self._dirty:
+            return self._dirty[filename]
         with open(filename, "rb") as f:
             return pickle.load(f)
 
+    def _stage_bucket(self, filename, bucket):
+        """Deja el bucket en memoria; se escribe en el próximo flush."""
+        self._removed.discard(filename)
+        self._dirty[filename] = bucket
+
+    def flush(self):
+        """Escribe los buckets modificados, luego el directorio y borra los reemplazados.
+
+        Los buckets nuevos de un split tienen nombres nuevos, así que hasta que
+        se escribe el directorio el de disco sigue apuntando a buckets completos.
+        """
+        for filename, bucket in self._dirty.items():
+            self._save_bucket(filename, bucket)
+        self._dirty = {}
+        if self._directory_dirty:
+            self._save_directory()
+            self._directory_dirty = False
+        for filename in self._removed:
+            if os.path.exists(filename):
+                os.remove(filename)
+        self._removed = set()
+
+    def save_to_file(self, filename=None):
+        """Misma interfaz que los B+ tree: la usa el checkpoint del WAL."""
+        self.flush()
+
     def _save_bucket(self, filename, bucket):
         with open(filename, "wb") as f:
             pickle.dump(bucket, f)
@@ -68,14 +109,16 @@ class ExtendibleHashing:
         hash_key = self._hash(key)
         if hash_key not in self.directory:
             self.directory[hash_key] = self._bucket_path(f"bucket_{hash_key}.dat")
-            self._save_bucket(self.directory[hash_key], Bucket(self.bucket_size))
+            self._stage_bucket(self.directory[hash_key], Bucket(self.bucket_size))
+            self._directory_dirty = True
         
         filename = self.directory[hash_key]
         bucket = self._load_bucket(filename)
 
-        if not bucket.is_full():
+        if not bucket.is_full() or all(k == key for k, _ in bucket.records):
+            # Una clave repetida no se separa dividiendo: el bucket crece
             bucket.add(key, value)
-            self._save_bucket(filename, bucket)
+            self._stage_bucket(filename, bucket)
             return
 
         # Split bucket
@@ -97,24 +140,27 @@ class ExtendibleHashing:
         fname1 = self._bucket_path(f"bucket_{hashlib.md5(os.urandom(6)).hexdigest()[:6]}.dat")
         fname2 = self._bucket_path(f"bucket_{hashlib.md5(os.urandom(6)).hexdigest()[:6]}.dat")
 
+        # El bit que separa los dos buckets es el de posición local_depth
+        bit = -bucket.local_depth
         for k, v in old_records:
             h = self._hash(k)
-            if h.endswith("0"):
+            if h[bit] == "0":
                 b1.add(k, v)
             else:
                 b2.add(k, v)
 
         for k in list(self.directory):
             if self.directory[k] == filename:
-                if k[-1] == "0":
+                if k[bit] == "0":
                     self.directory[k] = fname1
                 else:
                     self.directory[k] = fname2
 
-        os.remove(filename)
-        self._save_bucket(fname1, b1)
-        self._save_bucket(fname2, b2)
-        self._save_directory()
+        self._dirty.pop(filename, None)
+        self._removed.add(filename)
+        self._stage_bucket(fname1, b1)
+        self._stage_bucket(fname2, b2)
+        self._directory_dirty = True
 
     def search(self, key):
         hash_key = self._hash(key)
@@ -134,36 +180,51 @@ class ExtendibleHashing:
             result.extend(b.range_search(k1, k2))
         return result
 
-    def remove(self, key):
+    def remove(self, key, value=None):
         hash_key = self._hash(key)
         if hash_key not in self.directory:
             return False
         file = self.directory[hash_key]
         b = self._load_bucket(file)
-        removed = b.remove(key)
-        self._save_bucket(file, b)
+        removed = b.remove(key, value)
+        if removed:
+            self._stage_bucket(file, b)
         return removed
 
+    def remap_values(self, mapping):
+        """Reemplaza cada valor v por mapping[v] (localizadores tras un reorganize)."""
+        for file in set(self.directory.values()):
+            b = self._load_bucket(file)
+            records = [(k, mapping.get(v, v)) for k, v in b.records]
+            if records != b.records:
+                b.records = records
+                self._stage_bucket(file, b)
+        self.flush()
+
 
 # ===========================
 # CARGA DESDE CSV Y PRUEBAS
 # ===========================
-hash_index = ExtendibleHashing()
+if __name__ == "__main__":
+    hash_index = ExtendibleHashing()
+
+    with open("productos_amazon.csv", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            hash_index.add(row["id"], row)
+            print(f"Agregado: {row['id']}")
 
-with open("productos_amazon.csv", newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        hash_index.add(row["id"], row)
-        print(f"Agregado: {row['id']}")
+    # Buscar por ID
+    print(hash_index.search("4c69b61db1fc16e7013b43fc926e502d"))
 
-# Buscar por ID
-print(hash_index.search("4c69b61db1fc16e7013b43fc926e502d"))
+    # Buscar por rango de ID
+    print(hash_index.range_search("4a", "5f"))
 
-# Buscar por rango de ID
-print(hash_index.range_search("4a", "5f"))
+    # Eliminar
+    hash_index.remove("4c69b61db1fc16e7013b43fc926e502d")
 
-# Eliminar
-hash_index.remove("4c69b61db1fc16e7013b43fc926e502d")
+    # Verificar que fue eliminado
+    print(hash_index.search("4c69b61db1fc16e7013b43fc926e502d"))
 
-# Verificar que fue eliminado
-print(hash_index.search("4c69b61db1fc16e7013b43fc926e502d"))
\ No newline at end of file
+    # Los cambios quedan en memoria hasta el flush
+    hash_index.flush()
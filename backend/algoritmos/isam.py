@@ -1,20 +1,54 @@
 """
-A simple two-level ISAM (Indexed Sequential Access Method) implementation using on-disk pages.
+A simple multi-level ISAM (Indexed Sequential Access Method) implementation using on-disk pages.
 
 This module provides:
-- Page: an on-disk page holding sorted keys and file offsets with overflow chaining.
-- ISAMIndex: a two-level ISAM index supporting build, search, range_search, add, and remove operations.
-
-Pages and index metadata are serialized with pickle for persistence.
+- Page: a page holding sorted keys and file offsets with overflow chaining.
+- PageCodec: the fixed-size binary layout of pages for INT, FLOAT and VARCHAR keys;
+  string keys can be stored prefix-compressed.
+- ISAMIndex: a static ISAM index (leaves under one or more directory levels) supporting
+  build, search, range_search, cursor, add, remove and compact operations.
+
+Pages are fixed-size slots of the data file, read with a single pread and rewritten
+in place, so the file only grows when a page is added. Directory levels below the
+root are pages of the same file; the metadata, with the root level, is serialized
+with pickle. Page accesses are counted in the shared buffer pool's stats;
+decoded pages are kept in a small LRU cache, so hot leaves skip the read.
 """
 
+import heapq
+import os
 import pickle
-from bisect import bisect_right
-from dataclasses import dataclass, field
+import struct
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field, replace
+from itertools import batched, islice
+from operator import itemgetter
 from pathlib import Path
-from threading import Lock
+from threading import RLock
 from typing import Protocol, Self
 
+from algoritmos.buffer_pool import PAGE_SIZE, BufferPool, buffer_pool, count_pages
+from algoritmos.key_compression import common_prefix, shortest_separator
+
+# Decoded pages kept per index (ISAM_PAGE_CACHE pages)
+DEFAULT_PAGE_CACHE = int(os.environ.get("ISAM_PAGE_CACHE", 256))
+# Fill factor of the primary pages written by compact(), leaving room for inserts
+DEFAULT_FILL_FACTOR = 0.8
+# Automatic compaction: average overflow pages per leaf, or fraction of unused entry
+# slots in the file, beyond which add/remove compact the index
+COMPACT_CHAIN_LENGTH = float(os.environ.get("ISAM_COMPACT_CHAIN", 2.0))
+COMPACT_GARBAGE_RATIO = float(os.environ.get("ISAM_COMPACT_GARBAGE", 0.6))
+COMPACT_MIN_PAGES = 8  # smaller indexes are never compacted automatically
+# Metadata format: 1 = pickled pages appended on every write, 2 = fixed-size binary pages
+# with every leaf offset in the metadata, 3 = directory levels stored as pages
+FORMAT_VERSION = 3
+# Page header: entry count, key prefix length, key slot width, overflow page offset
+PAGE_HEADER = struct.Struct("<HHHq")
+NO_OVERFLOW = -1
+OFFSET = struct.Struct("<q")
+
 
 class SupportsRichComparison(Protocol):
     """Keys must support all four rich comparisons."""
@@ -65,47 +99,231 @@ class Page[K : SupportsRichComparison]:
         self.keys.insert(idx, key)
         self.offsets.insert(idx, offset)
 
-    def delete(self, key: K) -> bool:
+    def find(self, key: K) -> int | None:
+        """
+        Binary-search the page for a key.
+
+        Args:
+            key (K): The key to look up.
+
+        Returns:
+            int | None: Offset of the first entry with the key, or None.
+
+        """
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return self.offsets[idx]
+        return None
+
+    def delete(self, key: K, offset: int | None = None) -> bool:
         """
         Remove a key and its offset from the page if present.
 
         Args:
             key (K): The key to remove.
+            offset (int | None, optional): Only remove the entry pointing at this offset,
+                for keys that repeat. Defaults to the first entry with the key.
 
         Returns:
             bool: True if the key was found and removed, False otherwise.
 
         """
-        try:
-            idx = self.keys.index(key)
-            del self.keys[idx]
-            del self.offsets[idx]
-        except ValueError:
-            return False
-        else:
-            return True
-
-    def __getstate__(self):
-        # Remove the typing-generic info so pickle never sees it
-        state = self.__dict__.copy()
-        state.pop("__orig_class__", None)
-        return state
+        idx = bisect_left(self.keys, key)
+        while idx < len(self.keys) and self.keys[idx] == key:
+            if offset is None or self.offsets[idx] == offset:
+                del self.keys[idx]
+                del self.offsets[idx]
+                return True
+            idx += 1
+        return False
 
     def __setstate__(self, state: dict[str, object]):
-        # Restore everything else
+        # Pages pickled by the previous format, possibly with prefix-compressed keys
+        state.pop("__orig_class__", None)
+        state.pop("compress_keys", None)
+        prefix = state.pop("prefix", None)
+        if prefix is not None:
+            state["keys"] = [prefix + k for k in state["keys"]]
         self.__dict__.update(state)
 
 
+class PageCodec:
+    """
+    Fixed-size binary layout of the pages of one index.
+
+    A page is PAGE_HEADER, the key prefix shared by all its keys (compressed string
+    keys only), one fixed-width slot per key and the packed offsets, padded to
+    page_size. Keys use the struct code of their column: "i" (INT), "f" (FLOAT,
+    float32) or "<n>s" (VARCHAR(n), UTF-8).
+
+    Attributes:
+        key_format (str): struct code of the keys.
+        compress_keys (bool): Store string keys as a shared prefix plus suffixes.
+        page_size (int): Bytes per page, a multiple of the disk page size that fits
+            capacity uncompressed entries.
+
+    """
+
+    def __init__(self, key_format: str, capacity: int, compress_keys: bool = False) -> None:
+        """
+        Initialize the codec.
+
+        Args:
+            key_format (str): struct code of the keys ("i", "f", "q", "d" or "<n>s").
+            capacity (int): Entries a page must hold with uncompressed keys.
+            compress_keys (bool, optional): Prefix-compress string keys. Defaults to False.
+
+        """
+        self.key_format = key_format
+        self.key = struct.Struct("<" + key_format)
+        self.text = key_format.endswith("s")
+        self.compress_keys = compress_keys and self.text
+        entry = self.key.size + OFFSET.size
+        self.page_size = PAGE_SIZE * count_pages(PAGE_HEADER.size + capacity * entry)
+
+    def key_bytes(self, key: object) -> bytes:
+        """UTF-8 bytes of a string key, cut to the column width."""
+        return str(key).encode("utf-8")[: self.key.size]
+
+    def size(self, keys: list) -> int:
+        """
+        Bytes a page with these sorted keys takes.
+
+        Args:
+            keys (list): Sorted keys of the page.
+
+        Returns:
+            int: Encoded size, to compare against page_size.
+
+        """
+        if not self.compress_keys or not keys:
+            return PAGE_HEADER.size + len(keys) * (self.key.size + OFFSET.size)
+        raw = [self.key_bytes(k) for k in keys]
+        p = len(common_prefix(raw[0], raw[-1]))
+        width = max(len(r) for r in raw) - p
+        return PAGE_HEADER.size + p + len(keys) * (width + OFFSET.size)
+
+    def encode(self, page: Page) -> bytes:
+        """
+        Pack a page into page_size bytes.
+
+        Args:
+            page (Page): The page to encode.
+
+        Returns:
+            bytes: The page image.
+
+        Raises:
+            ValueError: If the page does not fit in page_size.
+
+        """
+        n = len(page.keys)
+        prefix, width = b"", self.key.size
+        if self.text:
+            raw = [self.key_bytes(k) for k in page.keys]
+            if self.compress_keys and raw:
+                prefix = common_prefix(raw[0], raw[-1])
+                width = max(len(r) for r in raw) - len(prefix)
+            p = len(prefix)
+            keys = b"".join(r[p:].ljust(width, b"\0") for r in raw)
+        else:
+            keys = struct.pack(f"<{n}{self.key_format}", *page.keys)
+        overflow = NO_OVERFLOW if page.overflow_ptr is None else page.overflow_ptr
+        data = b"".join((
+            PAGE_HEADER.pack(n, len(prefix), width, overflow),
+            prefix,
+            keys,
+            struct.pack(f"<{n}q", *page.offsets),
+        ))
+        if len(data) > self.page_size:
+            raise ValueError(f"ISAM page of {len(data)} bytes exceeds {self.page_size}")
+        return data.ljust(self.page_size, b"\0")
+
+    def decode(self, buf: bytes, capacity: int) -> Page:
+        """
+        Unpack a page image.
+
+        Args:
+            buf (bytes): page_size bytes read from the data file.
+            capacity (int): Capacity of the returned page.
+
+        Returns:
+            Page: The decoded page.
+
+        """
+        n, p, width, overflow = PAGE_HEADER.unpack_from(buf)
+        pos = PAGE_HEADER.size
+        if self.text:
+            prefix = bytes(buf[pos : pos + p])
+            pos += p
+            if width:
+                keys = [
+                    (prefix + buf[i : i + width].rstrip(b"\0")).decode("utf-8", "replace")
+                    for i in range(pos, pos + n * width, width)
+                ]
+            else:
+                # Every key equals the prefix
+                keys = [prefix.decode("utf-8", "replace")] * n
+        else:
+            keys = list(struct.unpack_from(f"<{n}{self.key_format}", buf, pos))
+        offsets = list(struct.unpack_from(f"<{n}q", buf, pos + n * width))
+        return Page(keys, offsets, None if overflow == NO_OVERFLOW else overflow, capacity)
+
+
+def infer_key_format(key: object) -> str:
+    """
+    struct code for keys of key's type, when the caller did not give one.
+
+    Args:
+        key (object): A sample key.
+
+    Returns:
+        str: "q" for ints, "d" for floats.
+
+    Raises:
+        ValueError: For string keys, whose width must come from the column.
+
+    """
+    if isinstance(key, int):
+        return "q"
+    if isinstance(key, float):
+        return "d"
+    raise ValueError(f"ISAMIndex needs a key_format for {type(key).__name__} keys")
+
+
 class ISAMIndex[K : SupportsRichComparison]:
     """
-    Two-level on-disk ISAM index with overflow chaining for inserts beyond page capacity.
+    Static on-disk ISAM index with overflow chaining for inserts beyond page capacity.
+
+    The leaves are the first num_leaves pages of the data file, in key order. Above
+    them sit `levels` directory levels built with the leaves; only the root level
+    (split_keys and root_children) stays in memory, the others are pages read while
+    descending. Inserts never change the directory.
+
+    add, remove and remap_values keep the pages they change in memory until
+    flush (or save_to_file, which a write-ahead log calls at its checkpoints), so
+    between flushes the files hold the last flushed state.
 
     Attributes:
-        index_path (Path): File path for the index metadata (split_keys and leaf_offsets).
-        data_path (Path): File path for serialized Page objects.
+        index_path (Path): File path for the index metadata (root level and page format).
+        data_path (Path): File path for the fixed-size binary pages.
         leaf_capacity (int): Capacity for each leaf page.
-        split_keys (list[K]): Split keys demarcating leaf page ranges.
-        leaf_offsets (list[int]): File offsets to each leaf page.
+        key_format (str | None): struct code of the keys; inferred from the first key
+            when not given (ints and floats only).
+        compress_keys (bool): Prefix-compress string keys in pages and use the
+            shortest separators as split keys.
+        directory_levels (int | None): Directory levels to build; None adds levels
+            until the root fits in one page.
+        split_keys (list[K]): Split keys of the root level.
+        root_children (list[int]): File offsets of the root's children.
+        num_leaves (int): Number of leaf pages.
+        levels (int): Directory levels, root included.
+        entries (int): Number of key-offset pairs in the index; saved with the
+            metadata on every flush, so it always matches the pages on disk.
+        auto_compact (bool): Compact after add/remove once overflow chains or unused
+            space cross COMPACT_CHAIN_LENGTH / COMPACT_GARBAGE_RATIO.
+        cache_pages (int): Maximum number of decoded pages kept in memory.
+        cache_stats (dict[str, int]): Page cache "hits" and "misses".
 
     """
 
@@ -114,136 +332,567 @@ class ISAMIndex[K : SupportsRichComparison]:
         index_path: Path,
         data_path: Path,
         leaf_capacity: int = 128,
+        pool: BufferPool | None = None,
+        compress_keys: bool = False,
+        cache_pages: int = DEFAULT_PAGE_CACHE,
+        key_format: str | None = None,
+        auto_compact: bool = True,
+        directory_levels: int | None = None,
     ) -> None:
         """
         Initialize an ISAMIndex, loading existing metadata or creating new files.
 
+        An index written in a previous format is converted on load.
+
         Args:
             index_path (Path): Path to the index metadata file.
             data_path (Path): Path to the page data file.
             leaf_capacity (int, optional): Maximum entries per leaf page. Defaults to 128.
+            pool (BufferPool | None, optional): Buffer pool whose stats count the page
+                accesses, under the data file's stem. Defaults to the shared pool.
+            compress_keys (bool, optional): Compress string keys. An existing index
+                keeps the setting it was built with. Defaults to False.
+            cache_pages (int, optional): Capacity of the decoded page cache. Defaults
+                to ISAM_PAGE_CACHE (256).
+            key_format (str | None, optional): struct code of the keys: "i" (INT),
+                "f" (FLOAT) or "<n>s" (VARCHAR(n)). Defaults to inferring it.
+            auto_compact (bool, optional): Compact automatically. Defaults to True.
+            directory_levels (int | None, optional): Directory levels, root included;
+                1 keeps the whole directory in memory. Defaults to as many as needed
+                for a single-page root. An existing index keeps its setting.
 
         """
         self.index_path = index_path
         self.data_path = data_path
         self.leaf_capacity = leaf_capacity
+        self.key_format = key_format
+        self.compress_keys = compress_keys
+        self.directory_levels = directory_levels
         self.split_keys: list[K] = []
-        self.leaf_offsets: list[int] = []
-        self._lock = Lock()
-
+        self.root_children: list[int] = []
+        self.num_leaves = 0
+        self.levels = 1
+        self.entries = 0
+        self.auto_compact = auto_compact
+        self.cache_pages = max(int(cache_pages), 0)
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.pool = pool or buffer_pool
+        self.owner = self.data_path.stem
+        self._codec: PageCodec | None = None
+        self._num_pages = 0
+        self._directory_pages = 0
+        # Writes replace the cached copy, so the cache never serves a stale page
+        self._cache: OrderedDict[int, Page[K]] = OrderedDict()
+        # Pages changed since the last flush, by offset; never evicted
+        self._dirty: dict[int, Page[K]] = {}
+        # Reentrant: add/remove hold it while reading pages through the cache
+        self._lock = RLock()
+
+        legacy = None
         if self.index_path.exists():
-            self._load_index()
+            legacy = self._load_index()
         else:
-            self.split_keys = []
-            self.leaf_offsets = []
             self._write_index()
             self.data_path.parent.mkdir(parents=True, exist_ok=True)
             self.data_path.write_bytes(b"")
+        # Kept open: pages are read with pread and written in place with pwrite
+        self._file = Path.open(self.data_path, "r+b")
+        self._fd = self._file.fileno()
+        if legacy is not None:
+            self._convert_legacy(legacy)
+        elif self.key_format is not None:
+            self._set_codec()
+
+    def close(self) -> None:
+        """Flush pending changes, close the data file handle and drop the cached pages."""
+        with self._lock:
+            self.flush()
+            self._file.close()
+            self._cache.clear()
+
+    def flush(self) -> None:
+        """Write the pages changed since the last flush, then the metadata."""
+        with self._lock:
+            self._flush_pages()
+            self._write_index()
 
-    def _load_index(self) -> None:
-        """Load split_keys and leaf_offsets from the index metadata file."""
+    def save_to_file(self, filename: str | None = None) -> None:
+        """Persist the index (same interface as the B+ trees, used by the WAL)."""
+        self.flush()
+
+    def _flush_pages(self) -> None:
+        """Write the pending pages in file order and hand them to the page cache."""
+        for ptr in sorted(self._dirty):
+            page = self._dirty[ptr]
+            data = self._codec.encode(page)
+            os.pwrite(self._fd, data, ptr)
+            self.pool.count(self.owner, writes=count_pages(len(data)))
+            self._cache_page(ptr, page)
+        self._dirty.clear()
+
+    def _load_index(self) -> dict | None:
+        """
+        Load the root level and the page format from the index metadata file.
+
+        Returns:
+            dict | None: The metadata if it is of a previous format, else None.
+
+        """
         with Path.open(self.index_path, "rb") as f:
             data = pickle.load(f)  # noqa: S301
-            self.split_keys = data["split_keys"]
-            self.leaf_offsets = data["leaf_offsets"]
+        self.compress_keys = data.get("compress_keys", False)
+        if data.get("format", 1) < FORMAT_VERSION:
+            return data
+        self.split_keys = data["split_keys"]
+        self.root_children = data["root_children"]
+        self.num_leaves = data["num_leaves"]
+        self.levels = data["levels"]
+        self.directory_levels = data["directory_levels"]
+        self.key_format = data["key_format"]
+        self.leaf_capacity = data["leaf_capacity"]
+        self.entries = data["entries"]
+        self._directory_pages = data["directory_pages"]
+        return None
 
     def _write_index(self) -> None:
-        """Atomically write split_keys and leaf_offsets to the index metadata file."""
+        """Atomically write the root level and the page format to the metadata file."""
         tmp = self.index_path.with_suffix(".tmp")
         with Path.open(tmp, "wb") as f:
             pickle.dump({
+                "format": FORMAT_VERSION,
                 "split_keys": self.split_keys,
-                "leaf_offsets": self.leaf_offsets,
+                "root_children": self.root_children,
+                "num_leaves": self.num_leaves,
+                "levels": self.levels,
+                "directory_levels": self.directory_levels,
+                "compress_keys": self.compress_keys,
+                "key_format": self.key_format,
+                "leaf_capacity": self.leaf_capacity,
+                "entries": self.entries,
+                "directory_pages": self._directory_pages,
             }, f)
         Path.replace(tmp, self.index_path)
 
-    def _read_page(self, ptr: int) -> Page[K]:
+    def _set_codec(self, key: K | None = None) -> None:
         """
-        Deserialize and return a Page object from the data file at the given offset.
+        Fix the page layout, inferring key_format from key if it was not given.
+
+        Args:
+            key (K | None, optional): First key stored in the index.
+
+        """
+        if self.key_format is None:
+            self.key_format = infer_key_format(key)
+        self._codec = PageCodec(self.key_format, self.leaf_capacity, self.compress_keys)
+        self._num_pages = os.fstat(self._fd).st_size // self._codec.page_size
+
+    def _convert_legacy(self, data: dict) -> None:
+        """
+        Rebuild an index written in a previous format.
+
+        Format 1 holds pickled pages; format 2 binary pages with every leaf offset
+        in the metadata.
+
+        Args:
+            data (dict): The old metadata.
+
+        """
+        if data.get("format", 1) == 2:
+            self.key_format = data["key_format"]
+            self.leaf_capacity = data["leaf_capacity"]
+            self._set_codec()
+            pairs = list(self._scan_pairs(self._fd, data["leaf_offsets"]))
+        else:
+            pairs = []
+            for leaf_ptr in data["leaf_offsets"]:
+                ptr = leaf_ptr
+                while ptr is not None:
+                    self._file.seek(ptr)
+                    page = pickle.load(self._file)  # noqa: S301
+                    pairs.extend(zip(page.keys, page.offsets, strict=False))
+                    ptr = page.overflow_ptr
+            pairs.sort(key=lambda pair: pair[0])
+        self.build(pairs)
+
+    def _read_page(self, ptr: int, *, for_update: bool = False) -> Page[K]:
+        """
+        Return the Page at the given offset, from the cache or read with one pread.
 
         Args:
             ptr (int): Byte offset in data_path.
+            for_update (bool, optional): Return a private copy the caller may modify;
+                cached pages are shared with concurrent readers. Defaults to False.
 
         Returns:
-            Page[K]: The deserialized page.
+            Page[K]: The decoded page.
 
         """
-        with Path.open(self.data_path, "rb") as f:
-            f.seek(ptr)
-            return pickle.load(f)  # noqa: S301
-
-    def _write_page(self, page: Page[K]) -> int:
+        with self._lock:
+            page = self._dirty.get(ptr)
+            if page is None:
+                page = self._cache.get(ptr)
+            if page is not None:
+                if ptr in self._cache:
+                    self._cache.move_to_end(ptr)
+                self.cache_stats["hits"] += 1
+            else:
+                self.cache_stats["misses"] += 1
+                size = self._codec.page_size
+                page = self._codec.decode(os.pread(self._fd, size, ptr), self.leaf_capacity)
+                self.pool.count(self.owner, reads=count_pages(size))
+                self._cache_page(ptr, page)
+        if for_update:
+            return replace(page, keys=list(page.keys), offsets=list(page.offsets))
+        return page
+
+    def _cache_page(self, ptr: int, page: Page[K]) -> None:
+        """Keep a decoded page, evicting the least recently used one when full."""
+        if not self.cache_pages:
+            return
+        self._cache[ptr] = page
+        self._cache.move_to_end(ptr)
+        if len(self._cache) > self.cache_pages:
+            self._cache.popitem(last=False)
+
+    def _write_page(self, page: Page[K], ptr: int | None = None) -> int:
         """
-        Serialize a Page object by appending it to the data file.
+        Write a Page in place, or in a new slot at the end of the data file.
 
         Args:
             page (Page[K]): The page to write.
+            ptr (int | None, optional): Offset of the page to overwrite. Defaults to
+                a new page.
 
         Returns:
             int: Byte offset where the page was written.
 
         """
-        data = pickle.dumps(page)
-        with Path.open(self.data_path, "ab") as f:
-            ptr = f.tell()
-            f.write(data)
+        data = self._codec.encode(page)
+        with self._lock:
+            if ptr is None:
+                ptr = self._num_pages * self._codec.page_size
+                self._num_pages += 1
+            os.pwrite(self._fd, data, ptr)
+            self.pool.count(self.owner, writes=count_pages(len(data)))
+            self._cache_page(ptr, page)
+        return ptr
+
+    def _stage_page(self, page: Page[K], ptr: int | None = None) -> int:
+        """
+        Keep a changed page in memory until the next flush.
+
+        Args:
+            page (Page[K]): The page to write.
+            ptr (int | None, optional): Offset of the page to overwrite. Defaults to
+                a new page at the end of the data file.
+
+        Returns:
+            int: Byte offset the page will be written to.
+
+        """
+        with self._lock:
+            if ptr is None:
+                ptr = self._num_pages * self._codec.page_size
+                self._num_pages += 1
+            self._cache.pop(ptr, None)
+            self._dirty[ptr] = page
         return ptr
 
-    def build(self, initial_data: list[tuple[K, int]]) -> None:
+    def _has_room(self, page: Page[K], key: K) -> bool:
         """
-        Build the two-level index from sorted (key, offset) pairs.
+        Check whether key still fits in the page.
+
+        Uncompressed pages hold leaf_capacity entries; compressed ones take keys
+        while the encoded page fits in page_size.
+
+        Args:
+            page (Page[K]): The page to insert into.
+            key (K): The key to insert.
+
+        Returns:
+            bool: True if the page can take the key.
+
+        """
+        if not self._codec.compress_keys:
+            return not page.is_full()
+        keys = list(page.keys)
+        keys.insert(bisect_right(keys, key), key)
+        return self._codec.size(keys) <= self._codec.page_size
+
+    def build(self, initial_data: list[tuple[K, int]], fill_factor: float = 1.0) -> None:
+        """
+        Build the index from sorted (key, offset) pairs, replacing the data file.
+
+        With compress_keys, leaves take keys while they fit in a page and each split
+        key is the shortest string that separates a leaf's last key from the next
+        leaf's first key.
 
         Args:
             initial_data (list[tuple[K, int]]): Sorted list of key-offset pairs.
+            fill_factor (float, optional): Fraction of each leaf to fill. Defaults to 1.0.
+
+        """
+        with self._lock:
+            if self._codec is None and initial_data:
+                self._set_codec(initial_data[0][0])
+            self._file.truncate(0)
+            self._num_pages = 0
+            self._cache.clear()
+            self._dirty.clear()
+            self._write_leaves(initial_data, fill_factor)
+            self._write_index()
+
+    def compact(self, fill_factor: float = DEFAULT_FILL_FACTOR) -> None:
+        """
+        Rewrite the index with no overflow pages, its leaves filled to fill_factor.
+
+        The live pairs are streamed in key order from the current file into a new
+        one, which then replaces data_path; the metadata is replaced right after.
+        Lookups stop paying for the overflow chains and unused slots left by the
+        write history.
+
+        Args:
+            fill_factor (float, optional): Fraction of each leaf to fill, leaving room
+                for inserts. Defaults to DEFAULT_FILL_FACTOR (0.8).
+
+        """
+        with self._lock:
+            if self._codec is None:
+                return
+            # The old file is streamed directly: it must hold every change first
+            self._flush_pages()
+            tmp = self.data_path.with_suffix(".compact")
+            old_file, old_fd = self._file, self._fd
+            leaves = [self._leaf_ptr(idx) for idx in range(self.num_leaves)]
+            pairs = self._scan_pairs(old_fd, leaves)
+            self._file = Path.open(tmp, "w+b")
+            self._fd = self._file.fileno()
+            self._num_pages = 0
+            self._cache.clear()
+            self._write_leaves(pairs, fill_factor)
+            os.fsync(self._fd)
+            Path.replace(tmp, self.data_path)
+            self._write_index()
+            old_file.close()
 
+    def _scan_pairs(self, fd: int, leaf_offsets: list[int]) -> Iterator[tuple[K, int]]:
         """
-        self.split_keys.clear()
-        self.leaf_offsets.clear()
+        Stream every key-offset pair in key order, bypassing the page cache.
 
-        for i in range(0, len(initial_data), self.leaf_capacity):
-            chunk = initial_data[i : i + self.leaf_capacity]
-            page = Page[K](capacity=self.leaf_capacity)
+        Args:
+            fd (int): File descriptor of the data file to read.
+            leaf_offsets (list[int]): Leaf pages of that file, in key order.
+
+        Yields:
+            tuple[K, int]: The pairs of each leaf and its overflow chain, merged.
+
+        """
+        size = self._codec.page_size
+        for ptr in leaf_offsets:
+            pages = []
+            while ptr is not None:
+                page = self._codec.decode(os.pread(fd, size, ptr), self.leaf_capacity)
+                self.pool.count(self.owner, reads=count_pages(size))
+                pages.append(zip(page.keys, page.offsets, strict=True))
+                ptr = page.overflow_ptr
+            yield from heapq.merge(*pages, key=itemgetter(0))
+
+    def _write_leaves(self, pairs: Iterable[tuple[K, int]], fill_factor: float) -> None:
+        """
+        Write sorted pairs as consecutive leaves, then the directory levels above them.
+
+        Args:
+            pairs (Iterable[tuple[K, int]]): Sorted key-offset pairs, written from the
+                start of an empty data file.
+            fill_factor (float): Fraction of each leaf to fill.
+
+        """
+        self.entries = 0
+        level: list[tuple[K, int]] = []  # (separator, page offset) of each node
+        last = None
+        for chunk in self._leaf_chunks(pairs, fill_factor):
+            page = self._new_page()
             page.keys = [k for k, _ in chunk]
             page.offsets = [ofs for _, ofs in chunk]
             ptr = self._write_page(page)
-            self.leaf_offsets.append(ptr)
-            self.split_keys.append(page.keys[0])
+            self.entries += len(chunk)
+            first = page.keys[0]
+            if last is not None and self.compress_keys:
+                first = shortest_separator(last, first)
+            level.append((first, ptr))
+            last = page.keys[-1]
+        self.num_leaves = len(level)
+        self._write_directory(level)
+
+    def _write_directory(self, level: list[tuple[K, int]]) -> None:
+        """
+        Write the directory pages over a level of nodes and keep its root in memory.
+
+        A directory page stores one (separator, child offset) entry per child; the
+        first separator is never compared.
+
+        Args:
+            level (list[tuple[K, int]]): (separator, page offset) of each leaf.
+
+        """
+        self.levels = 1
+        self._directory_pages = 0
+        while len(level) > 1 and not self._root_fits(level):
+            parents = []
+            for chunk in self._leaf_chunks(level, 1.0):
+                page = self._new_page()
+                page.keys = [k for k, _ in chunk]
+                page.offsets = [ptr for _, ptr in chunk]
+                parents.append((page.keys[0], self._write_page(page)))
+                self._directory_pages += 1
+            level = parents
+            self.levels += 1
+        self.split_keys = [k for k, _ in level[1:]]
+        self.root_children = [ptr for _, ptr in level]
+
+    def _root_fits(self, level: list[tuple[K, int]]) -> bool:
+        """Whether level can be the root: the configured depth, or a single page."""
+        if self.directory_levels is not None:
+            return self.levels >= self.directory_levels
+        return self._codec.size([k for k, _ in level]) <= self._codec.page_size
+
+    def _leaf_ptr(self, leaf_idx: int) -> int:
+        """File offset of a leaf: leaves are the first pages of the data file."""
+        return leaf_idx * self._codec.page_size
+
+    def _leaf_chunks(self, pairs: Iterable[tuple[K, int]], fill_factor: float):
+        """
+        Split sorted pairs into the contents of consecutive leaves.
+
+        Args:
+            pairs (Iterable[tuple[K, int]]): Sorted key-offset pairs.
+            fill_factor (float): Fraction of each leaf to fill.
+
+        Yields:
+            list[tuple[K, int]]: The pairs of one leaf.
+
+        """
+        if not self._codec or not self._codec.compress_keys:
+            yield from batched(pairs, max(1, int(self.leaf_capacity * fill_factor)))
+            return
+        # Page size with the prefix of the first and last key and the widest suffix
+        raw = self._codec.key_bytes
+        limit = (self._codec.page_size - PAGE_HEADER.size) * fill_factor
+        chunk: list[tuple[K, int]] = []
+        first, longest = b"", 0
+        for pair in pairs:
+            key = raw(pair[0])
+            p = len(common_prefix(first, key))
+            width = max(longest, len(key))
+            if chunk and p + (len(chunk) + 1) * (width - p + OFFSET.size) > limit:
+                yield chunk
+                chunk = []
+            if not chunk:
+                # The pair starts a new leaf
+                first, width = key, len(key)
+            longest = width
+            chunk.append(pair)
+        if chunk:
+            yield chunk
+
+    def remap_values(self, mapping: dict[int, int]) -> None:
+        """
+        Replace every offset v with mapping[v], in one pass over the leaves and chains.
+
+        Used as a reorganize listener: record locators that moved are patched in
+        place, and only the pages holding one of them are rewritten.
 
-        if self.split_keys:
-            self.split_keys = self.split_keys[1:]
-        self._write_index()
+        Args:
+            mapping (dict[int, int]): Old offset -> new offset, for the moved records.
 
-    def _find_leaf_index(self, key: K) -> int:
         """
-        Determine the leaf page index for a given key using split_keys.
+        with self._lock:
+            if not mapping:
+                return
+            for leaf_idx in range(self.num_leaves):
+                ptr = self._leaf_ptr(leaf_idx)
+                while ptr is not None:
+                    page = self._read_page(ptr, for_update=True)
+                    offsets = [mapping.get(ofs, ofs) for ofs in page.offsets]
+                    if offsets != page.offsets:
+                        page.offsets = offsets
+                        self._stage_page(page, ptr)
+                    ptr = page.overflow_ptr
+            self.flush()
+
+    def page_stats(self) -> dict[str, float]:
+        """
+        Summarize how much the write history has degraded the layout.
+
+        Returns:
+            dict[str, float]: "pages", "leaves", "entries", "chain_length" (average
+                overflow pages per leaf) and "garbage_ratio" (unused entry slots).
+
+        """
+        leaves = self.num_leaves
+        data_pages = self._num_pages - self._directory_pages
+        slots = data_pages * self.leaf_capacity
+        return {
+            "pages": self._num_pages,
+            "leaves": leaves,
+            "entries": self.entries,
+            "chain_length": (data_pages - leaves) / leaves if leaves else 0.0,
+            "garbage_ratio": max(0.0, 1 - self.entries / slots) if slots else 0.0,
+        }
+
+    def _maybe_compact(self) -> None:
+        """Compact once overflow chains or unused space cross the thresholds."""
+        if not self.auto_compact or self._num_pages < COMPACT_MIN_PAGES:
+            return
+        stats = self.page_stats()
+        if (
+            stats["chain_length"] >= COMPACT_CHAIN_LENGTH
+            or stats["garbage_ratio"] >= COMPACT_GARBAGE_RATIO
+        ):
+            self.compact()
+
+    def _new_page(self) -> Page[K]:
+        """Return an empty page with this index's capacity."""
+        return Page[K](capacity=self.leaf_capacity)
+
+    def _find_leaf_index(self, key: K, *, first: bool = False) -> int:
+        """
+        Descend the directory from the root to the leaf for a given key.
 
         Args:
             key (K): The key to locate.
+            first (bool, optional): Return the first leaf that may hold key, for keys
+                repeated across leaves. Defaults to the leaf where key is inserted.
 
         Returns:
-            int: Index in leaf_offsets and split_keys.
+            int: Leaf index (position among the leaves).
 
         """
-        return bisect_right(self.split_keys, key)
+        find = bisect_left if first else bisect_right
+        ptr = self.root_children[find(self.split_keys, key)]
+        for _ in range(self.levels - 1):
+            page = self._read_page(ptr)
+            ptr = page.offsets[find(page.keys, key, 1) - 1]
+        return ptr // self._codec.page_size
 
-    def _find_leaf(self, key: K) -> tuple[Page[K], int]:
+    def _find_leaf(self, key: K, *, for_update: bool = False) -> tuple[Page[K], int]:
         """
         Retrieve the Page object and its index for a specific key.
 
         Args:
             key (K): Key to find.
+            for_update (bool, optional): Return a private copy of the page.
 
         Returns:
             tuple[Page[K], int]: (Page, leaf index)
 
         """
         idx = self._find_leaf_index(key)
-        ptr = self.leaf_offsets[idx]
-        return self._read_page(ptr), idx
+        return self._read_page(self._leaf_ptr(idx), for_update=for_update), idx
 
     def search(self, key: K) -> int | None:
         """
-        Look up a single key, scanning the primary page and overflow chain.
+        Look up a single key, binary-searching the primary page and its overflow chain.
 
         Args:
             key (K): Key to search.
@@ -253,23 +902,15 @@ class ISAMIndex[K : SupportsRichComparison]:
 
         """
         # if we've never built any leaf pages, there is nothing to find
-        if not self.leaf_offsets:
+        if not self.num_leaves:
             print("ISAMIndex: no leaf pages built yet")
             return None
         page, _ = self._find_leaf(key)
-
-
-        for k, ofs in zip(page.keys, page.offsets, strict=False):
-            if k == key:
+        while True:
+            ofs = page.find(key)
+            if ofs is not None or page.overflow_ptr is None:
                 return ofs
-        ptr = page.overflow_ptr
-        while ptr is not None:
-            page = self._read_page(ptr)
-            for k, ofs in zip(page.keys, page.offsets, strict=False):
-                if k == key:
-                    return ofs
-            ptr = page.overflow_ptr
-        return None
+            page = self._read_page(page.overflow_ptr)
 
     def range_search(self, lo: K, hi: K) -> list[tuple[K, int]]:
         """
@@ -280,91 +921,161 @@ class ISAMIndex[K : SupportsRichComparison]:
             hi (K): Upper bound of range.
 
         Returns:
-            list[tuple[K, int]]: List of (key, offset) in range order.
+            list[tuple[K, int]]: List of (key, offset) in key order.
+
+        """
+        return list(self.cursor(lo, hi))
+
+    def cursor(
+        self,
+        start_key: K | None = None,
+        end_key: K | None = None,
+        descending: bool = False,
+        limit: int | None = None,
+    ) -> Iterator[tuple[K, int]]:
+        """
+        Lazily yield the key-offset pairs with start_key <= key <= end_key, in key order.
+
+        Reads one leaf (and its overflow chain) at a time and stops after limit pairs,
+        so a query with LIMIT never reads the whole range.
+
+        Args:
+            start_key (K | None, optional): Lower bound; None leaves it open.
+            end_key (K | None, optional): Upper bound; None leaves it open.
+            descending (bool, optional): Walk the leaves backwards. Defaults to False.
+            limit (int | None, optional): Maximum number of pairs. Defaults to all.
+
+        Yields:
+            tuple[K, int]: (key, offset) pairs.
 
         """
         # empty index ⇒ no hits
-        if not self.leaf_offsets:
-            return []
-        results: list[tuple[K, int]] = []
-
-        start = bisect_right(self.split_keys, lo)
-        for leaf_ptr in self.leaf_offsets[start:]:
-            page = self._read_page(leaf_ptr)
-            for k, ofs in zip(page.keys, page.offsets, strict=False):
-                if lo <= k <= hi:
-                    results.append((k, ofs))
+        if not self.num_leaves or (limit is not None and limit <= 0):
+            return
+        if descending:
+            entries = self._cursor_backward(start_key, end_key)
+        else:
+            entries = self._cursor_forward(start_key, end_key)
+        yield from islice(entries, limit)
+
+    def _cursor_forward(self, lo: K | None, hi: K | None) -> Iterator[tuple[K, int]]:
+        # A repeated key can span several leaves: start at the first that may hold lo
+        start = 0 if lo is None else self._find_leaf_index(lo, first=True)
+        for leaf_idx in range(start, self.num_leaves):
+            pairs = self._leaf_pairs(leaf_idx)
+            first = 0 if lo is None else bisect_left(pairs, lo, key=itemgetter(0))
+            for k, ofs in islice(pairs, first, None):
+                if hi is not None and k > hi:
+                    return
+                yield k, ofs
+
+    def _cursor_backward(self, lo: K | None, hi: K | None) -> Iterator[tuple[K, int]]:
+        stop = self.num_leaves - 1 if hi is None else self._find_leaf_index(hi)
+        for leaf_idx in range(stop, -1, -1):
+            pairs = self._leaf_pairs(leaf_idx)
+            end = len(pairs) if hi is None else bisect_right(pairs, hi, key=itemgetter(0))
+            for k, ofs in reversed(pairs[:end]):
+                if lo is not None and k < lo:
+                    return
+                yield k, ofs
+
+    def _leaf_pairs(self, leaf_idx: int) -> list[tuple[K, int]]:
+        """
+        Key-offset pairs of a leaf and its overflow chain, merged in key order.
+
+        Args:
+            leaf_idx (int): Leaf index.
+
+        Returns:
+            list[tuple[K, int]]: The sorted pairs.
+
+        """
+        pages = []
+        ptr = self._leaf_ptr(leaf_idx)
+        while ptr is not None:
+            page = self._read_page(ptr)
+            pages.append(zip(page.keys, page.offsets, strict=True))
             ptr = page.overflow_ptr
-            while ptr is not None:
-                page = self._read_page(ptr)
-                for k, ofs in zip(page.keys, page.offsets, strict=False):
-                    if lo <= k <= hi:
-                        results.append((k, ofs))
-                ptr = page.overflow_ptr
-            if page.keys and page.keys[-1] > hi:
-                break
-        return results
+        return list(heapq.merge(*pages, key=itemgetter(0)))
 
     def add(self, key: K, ofs: int) -> None:
         """
         Insert a key-offset pair, using overflow chaining if the leaf page is full.
 
+        The page is changed in memory and rewritten in place on the next flush.
+
         Args:
             key (K): The key to insert.
             ofs (int): File offset of the record.
 
         """
         with self._lock:
-            page, leaf_idx = self._find_leaf(key)
-            if not page.is_full():
-                page.insert(key, ofs)
-                new_ptr = self._write_page(page)
-                self.leaf_offsets[leaf_idx] = new_ptr
-            else:
+            if self._codec is None:
+                self._set_codec(key)
+            if not self.num_leaves:
+                # Index built from an empty table: start with a single leaf
+                self.root_children = [self._stage_page(self._new_page())]
+                self.num_leaves = 1
+            page, leaf_idx = self._find_leaf(key, for_update=True)
+            ptr = self._leaf_ptr(leaf_idx)
+            # First page of the chain with room; a new overflow page at its end otherwise
+            while not self._has_room(page, key):
                 if page.overflow_ptr is None:
-                    ov = Page[K](capacity=self.leaf_capacity)
-                    page.overflow_ptr = self._write_page(ov)
-                    self.leaf_offsets[leaf_idx] = self._write_page(page)
-                ov_page = self._read_page(page.overflow_ptr)
-                ov_page.insert(key, ofs)
-                new_ov_ptr = self._write_page(ov_page)
-                page.overflow_ptr = new_ov_ptr
-                self.leaf_offsets[leaf_idx] = self._write_page(page)
-            self._write_index()
+                    page.overflow_ptr = self._stage_page(self._new_page())
+                    self._stage_page(page, ptr)
+                ptr = page.overflow_ptr
+                page = self._read_page(ptr, for_update=True)
+            page.insert(key, ofs)
+            self._stage_page(page, ptr)
+            self.entries += 1
+            self._maybe_compact()
 
-    def remove(self, key: K) -> bool:
+    def remove(self, key: K, ofs: int | None = None) -> bool:
         """
-        Remove a key-offset pair from the index, updating overflow links if needed.
+        Remove a key-offset pair; its page is rewritten on the next flush.
 
         Args:
             key (K): The key to remove.
+            ofs (int | None, optional): Offset of the entry to remove when the key
+                repeats. Defaults to the first entry found with the key.
 
         Returns:
             bool: True if removal succeeded, False otherwise.
 
         """
         with self._lock:
-            page, leaf_idx = self._find_leaf(key)
-            if page.delete(key):
-                self.leaf_offsets[leaf_idx] = self._write_page(page)
-                self._write_index()
-                return True
+            if not self.num_leaves:
+                return False
+            # Every leaf whose range may contain a repeated key
+            first = self._find_leaf_index(key, first=True)
+            last = self._find_leaf_index(key)
+            removed = any(
+                self._remove_from_leaf(leaf_idx, key, ofs)
+                for leaf_idx in range(first, last + 1)
+            )
+            if removed:
+                self.entries -= 1
+                self._maybe_compact()
+            return removed
+
+    def _remove_from_leaf(self, leaf_idx: int, key: K, ofs: int | None) -> bool:
+        """
+        Remove the entry from one leaf or its overflow chain.
 
-            prev_ptr: int | None = None
-            ptr = page.overflow_ptr
-            while ptr is not None:
-                ov = self._read_page(ptr)
-                if ov.delete(key):
-                    new_ptr = self._write_page(ov)
-                    if prev_ptr is None:
-                        page.overflow_ptr = new_ptr
-                        self.leaf_offsets[leaf_idx] = self._write_page(page)
-                    else:
-                        prev = self._read_page(prev_ptr)
-                        prev.overflow_ptr = new_ptr
-                        self._write_page(prev)
-                    self._write_index()
-                    return True
-                prev_ptr, ptr = ptr, ov.overflow_ptr
+        Args:
+            leaf_idx (int): Leaf index.
+            key (K): The key to remove.
+            ofs (int | None): Offset of the entry, or None for any.
 
+        Returns:
+            bool: True if an entry was removed.
+
+        """
+        ptr = self._leaf_ptr(leaf_idx)
+        while ptr is not None:
+            page = self._read_page(ptr, for_update=True)
+            if page.delete(key, ofs):
+                self._stage_page(page, ptr)
+                return True
+            ptr = page.overflow_ptr
         return False
@@ -0,0 +1,27 @@
+import os
+
+
+def common_prefix(first, last):
+    """Prefijo común de first y last (bytes o str).
+
+    En una secuencia ordenada el prefijo común de todas las claves es el de
+    la primera y la última.
+    """
+    return first[: len(os.path.commonprefix((first, last)))]
+
+
+def shortest_separator(left, right):
+    """Clave más corta s con left < s <= right (truncamiento de sufijo).
+
+    Sirve como separador en los niveles internos: basta con distinguir la
+    última clave de un nodo de la primera del siguiente, no hace falta guardar
+    la clave completa. No termina en espacio, porque las columnas VARCHAR
+    guardan el texto sin espacios finales.
+    """
+    if not isinstance(right, str) or left is None or not left < right:
+        return right
+    for end in range(1, len(right) + 1):
+        candidate = right[:end]
+        if candidate > left and not candidate[-1].isspace():
+            return candidate
+    return right
@@ -0,0 +1,73 @@
+import mmap
+import os
+
+
+class MappedFile:
+    """Lector de un archivo de registros de ancho fijo respaldado por mmap.
+
+    Los registros se sirven por número de slot como slices de un memoryview,
+    sin abrir el archivo ni hacer read() por registro. Las escrituras en el
+    lugar (p. ej. marcar eliminado) se ven a través del mapeo; después de
+    agregar registros o reemplazar el archivo hay que llamar a invalidate()
+    para que el siguiente acceso lo vuelva a mapear.
+    """
+
+    def __init__(self, path, record_size):
+        self.path = path
+        self.record_size = int(record_size)
+        self._file = None
+        self._map = None
+        self._view = None
+        self._stale = True
+
+    def invalidate(self):
+        self._stale = True
+
+    def _remap(self):
+        self.close()
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+        self._stale = False
+
+    @property
+    def view(self):
+        if self._stale:
+            self._remap()
+        return self._view if self._view is not None else memoryview(b"")
+
+    def __len__(self):
+        return len(self.view) // self.record_size
+
+    def record(self, slot):
+        """Bytes del registro en la posición slot (None si está fuera del archivo)."""
+        return self.read(slot * self.record_size, self.record_size)
+
+    def read(self, offset, size):
+        view = self.view
+        if offset < 0 or offset + size > len(view):
+            return None
+        return view[offset : offset + size]
+
+    def records(self):
+        """Recorre (slot, bytes) de todos los registros completos del archivo."""
+        view = self.view
+        rs = self.record_size
+        for slot in range(len(view) // rs):
+            yield slot, view[slot * rs : (slot + 1) * rs]
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Aún hay slices del mapeo anterior en uso; se libera con el GC
+                pass
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
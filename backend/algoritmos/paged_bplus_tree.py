@@ -0,0 +1,792 @@
+import os
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import count, groupby
+from operator import itemgetter
+
+from algoritmos.buffer_pool import PAGE_SIZE, PagedFile
+from algoritmos.bplus_tree import BPlusTree
+from algoritmos.key_compression import common_prefix, shortest_separator
+
+MAGIC = b"BPT2"
+# Página 0: magic, formato de clave, formato de valor, página raíz, número de páginas
+HEADER = struct.Struct("<4s16s16sII")
+# Byte de opciones a continuación de la cabecera (0 en los índices anteriores)
+HEADER_FLAGS = struct.Struct("<B")
+PREFIX_KEYS = 1  # claves de texto comprimidas por prefijo, separadores cortos
+PREFIX_LEN = struct.Struct("<H")
+# Cabecera de cada página: tipo, cantidad de entradas, siguiente página (0 = ninguna)
+NODE_HEADER = struct.Struct("<BHI")
+INTERNAL, LEAF, POSTING = 0, 1, 2
+BODY = PAGE_SIZE - NODE_HEADER.size
+CHILD = struct.Struct("<I")
+# Entrada de hoja: clave, n y n ids; si n == OVERFLOW, (total, primera página de la lista)
+ENTRY_COUNT = struct.Struct("<H")
+OVERFLOW = 0xFFFF
+OVERFLOW_REF = struct.Struct("<II")
+NODE_CACHE = 256  # nodos decodificados que se mantienen en memoria
+DEFAULT_FILL_FACTOR = 0.9  # ocupación de los nodos en la construcción masiva
+LOCATOR_FORMAT = "q"  # formato de los valores en índices con localizadores
+
+
+def _codec(code):
+    """(encode, decode) de un campo con formato struct code ("f", "i", "50s", ...)."""
+    if code.endswith("s"):
+        size = int(code[:-1])
+        return (
+            lambda v: str(v).strip().encode("utf-8")[:size].ljust(size, b" "),
+            lambda b: b.decode("utf-8", "replace").strip(),
+        )
+    if code in ("f", "d"):
+        return float, lambda v: v
+    return int, lambda v: v
+
+
+def _compress_default(key_format, compress_keys):
+    """Compresión de claves pedida, o la automática (solo claves de texto)."""
+    return key_format.endswith("s") if compress_keys is None else compress_keys
+
+
+def _remap(values, mapping):
+    """Aplica mapping a la lista values en el lugar; True si cambió algo."""
+    changed = False
+    for i, v in enumerate(values):
+        new = mapping.get(v, v)
+        if new != v:
+            values[i] = new
+            changed = True
+    return changed
+
+
+class _Postings:
+    """Lista de ids de una clave muy repetida, guardada en páginas propias."""
+
+    __slots__ = ("count", "head")
+
+    def __init__(self, count, head):
+        self.count = count
+        self.head = head
+
+
+class _Node:
+    __slots__ = ("page", "kind", "keys", "values", "children", "next")
+
+    def __init__(self, page, kind, keys=None, values=None, children=None, next=0):
+        self.page = page
+        self.kind = kind
+        self.keys = keys if keys is not None else []
+        # Hojas: una lista de ids (o _Postings) por clave; páginas POSTING: ids
+        self.values = values if values is not None else []
+        self.children = children if children is not None else []  # nodos internos
+        self.next = next
+
+    @property
+    def is_leaf(self):
+        return self.kind == LEAF
+
+
+class PagedBPlusTree:
+    """Árbol B+ cuyos nodos viven en páginas de tamaño fijo de un archivo de índice.
+
+    Cada nodo ocupa una página (PAGE_SIZE) con claves, valores e ids de página
+    codificados con struct. Las páginas se leen a través del buffer pool y se
+    mantiene una pequeña caché de nodos decodificados; al modificar el árbol
+    solo se marcan como sucios los nodos tocados (O(altura)) y save_to_file
+    escribe únicamente esas páginas. Abrir el índice solo lee la cabecera.
+    Dentro de cada nodo las claves están ordenadas y se buscan con bisect, al
+    bajar por los internos y en la hoja.
+
+    Las hojas guardan una entrada por clave distinta con su lista de ids
+    (posting list). Si una clave acumula más de inline_limit ids, la lista pasa
+    a páginas propias encadenadas y en la hoja queda solo (total, primera
+    página), así las claves muy repetidas (precio 0.0) no llenan hojas enteras.
+
+    Tiene la misma interfaz que BPlusTree (search, range_search, add, remove,
+    save_to_file, load_from_file). El borrado es perezoso: las hojas pueden
+    quedar con menos de la mitad de entradas, no se fusionan.
+    """
+
+    def __init__(self, filename, key_format, value_format, pool=None, compress_keys=False):
+        self.filename = filename
+        self.key_format = key_format
+        self.value_format = value_format
+        self._encode_key, self._decode_key = _codec(key_format)
+        self._encode_value, self._decode_value = _codec(value_format)
+        self._key = struct.Struct("<" + key_format)
+        self._value = struct.Struct("<" + value_format)
+        # Solo las claves de texto se comprimen: cada página guarda una vez el
+        # prefijo común y de cada clave el resto, con su largo
+        self.compress_keys = bool(compress_keys) and key_format.endswith("s")
+        self._key_len = struct.Struct("<B" if self._key.size < 256 else "<H")
+        self.internal_capacity = (BODY - CHILD.size) // (self._key.size + CHILD.size)
+        self.posting_capacity = BODY // self._value.size
+        # Una entrada en línea ocupa a lo más un cuarto de la hoja
+        self.inline_limit = max(
+            1, (BODY // 4 - self._key.size - ENTRY_COUNT.size) // self._value.size
+        )
+        self.root = 0
+        self.num_pages = 1
+        self.pages = PagedFile(
+            filename, PAGE_SIZE, os.path.splitext(os.path.basename(filename))[0], pool
+        )
+        self._cache = OrderedDict()  # página -> _Node (solo nodos limpios)
+        # Nodos modificados desde el último flush: quedan fijos en memoria y
+        # nunca se desalojan (no-steal), así el archivo solo cambia en flush y
+        # el WAL puede reaplicarse sobre el estado del último checkpoint
+        self._dirty = {}  # página -> _Node
+        self._header_dirty = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def create(cls, filename, key_format, value_format, pool=None, compress_keys=None):
+        """Crea un índice vacío (una hoja raíz) y lo escribe en filename.
+
+        compress_keys=None comprime las claves si son de texto.
+        """
+        with open(filename, "wb"):
+            pass
+        tree = cls(filename, key_format, value_format, pool, _compress_default(key_format, compress_keys))
+        tree.pages.invalidate()
+        tree.root = tree._allocate(LEAF).page
+        tree.flush()
+        return tree
+
+    @classmethod
+    def open(cls, filename, pool=None):
+        """Abre un índice existente leyendo solo la página de cabecera."""
+        with open(filename, "rb") as f:
+            buf = f.read(HEADER.size + HEADER_FLAGS.size)
+        magic, key_format, value_format, root, num_pages = HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} no es un índice B+ paginado")
+        (flags,) = HEADER_FLAGS.unpack_from(buf, HEADER.size)
+        tree = cls(
+            filename,
+            key_format.rstrip(b"\0").decode(),
+            value_format.rstrip(b"\0").decode(),
+            pool,
+            compress_keys=bool(flags & PREFIX_KEYS),
+        )
+        tree.pages.invalidate()
+        tree.root = root
+        tree.num_pages = num_pages
+        return tree
+
+    @classmethod
+    def bulk_load(
+        cls,
+        filename,
+        key_format,
+        value_format,
+        pairs,
+        fill_factor=DEFAULT_FILL_FACTOR,
+        pool=None,
+        compress_keys=None,
+    ):
+        """Construye el índice de abajo hacia arriba a partir de pares (clave, valor) ordenados.
+
+        Las hojas se llenan hasta fill_factor de su capacidad y se escriben en
+        orden (enlazadas por next) en una sola pasada; las listas de ids de
+        claves muy repetidas se escriben en páginas contiguas. Luego se arman
+        los niveles internos con la primera clave de cada hijo como separador
+        (o el separador más corto, con claves comprimidas). En memoria solo
+        queda (separador, página) de cada nodo del nivel en construcción.
+        """
+        tree = cls(
+            filename, key_format, value_format, pool, _compress_default(key_format, compress_keys)
+        )
+        leaf_bytes = int(BODY * fill_factor)
+        internal_fill = max(2, int((tree.internal_capacity + 1) * fill_factor))
+        pages = count(1)
+
+        with open(filename, "wb", buffering=1 << 20) as f:
+
+            def write(node):
+                f.seek(node.page * PAGE_SIZE)
+                f.write(tree._encode_node(node))
+
+            level = []  # (separador, página) de los nodos del nivel actual
+            pending = None  # hoja anterior: se escribe cuando se conoce la siguiente
+
+            def close(leaf):
+                nonlocal pending
+                leaf.page = next(pages)
+                if pending is not None:
+                    pending.next = leaf.page
+                    write(pending)
+                    separator = tree._separator(pending.keys[-1], leaf.keys[0])
+                else:
+                    separator = leaf.keys[0] if leaf.keys else None
+                level.append((separator, leaf.page))
+                pending = leaf
+
+            def groups(level):
+                """Hijos de cada nodo interno: por cantidad, o por bytes con claves comprimidas."""
+                if not tree.compress_keys:
+                    for i in range(0, len(level), internal_fill):
+                        yield level[i : i + internal_fill]
+                    return
+                group, used = [], PREFIX_LEN.size
+                for entry in level:
+                    # Sin descontar el prefijo común: la estimación queda por arriba
+                    size = CHILD.size
+                    if group:
+                        size += tree._key_len.size + len(tree._key_bytes(entry[0]))
+                    if len(group) > 1 and used + size > leaf_bytes:
+                        yield group
+                        group, used = [], PREFIX_LEN.size + CHILD.size
+                    else:
+                        used += size
+                    group.append(entry)
+                yield group
+
+            leaf, used, first = _Node(0, LEAF), 0, b""
+            entries = groupby(((tree.normalize(k), v) for k, v in pairs), key=itemgetter(0))
+            for key, group in entries:
+                values = [v for _, v in group]
+                if len(values) > tree.inline_limit:
+                    values = tree._write_postings(values, pages, write)
+                size = tree._entry_size(values, key)
+                projected = used + size
+                if tree.compress_keys:
+                    # La hoja guarda una vez el prefijo común de su primera y última clave
+                    raw = tree._key_bytes(key)
+                    p = len(common_prefix(first if leaf.keys else raw, raw))
+                    projected += PREFIX_LEN.size + p - (len(leaf.keys) + 1) * p
+                if leaf.keys and projected > leaf_bytes:
+                    close(leaf)
+                    leaf, used = _Node(0, LEAF), 0
+                if not leaf.keys and tree.compress_keys:
+                    first = raw
+                leaf.keys.append(key)
+                leaf.values.append(values)
+                used += size
+            close(leaf)
+            write(pending)
+
+            while len(level) > 1:
+                parents = []
+                for group in groups(level):
+                    node = _Node(
+                        next(pages),
+                        INTERNAL,
+                        keys=[key for key, _ in group[1:]],
+                        children=[page for _, page in group],
+                    )
+                    write(node)
+                    parents.append((group[0][0], node.page))
+                level = parents
+
+            tree.root = level[0][1]
+            tree.num_pages = next(pages)
+            f.seek(0)
+            f.write(tree._header_page())
+
+        tree.pages.rewritten(tree.num_pages * PAGE_SIZE)
+        return tree
+
+    def _write_postings(self, values, pages, write):
+        """Escribe values en páginas POSTING contiguas (construcción masiva)."""
+        cap = self.posting_capacity
+        nodes = [
+            _Node(next(pages), POSTING, values=values[i : i + cap])
+            for i in range(0, len(values), cap)
+        ]
+        for node, following in zip(nodes, nodes[1:]):
+            node.next = following.page
+        for node in nodes:
+            write(node)
+        return _Postings(len(values), nodes[0].page)
+
+    # --- páginas y caché de nodos ---
+
+    def _allocate(self, kind):
+        node = _Node(self.num_pages, kind)
+        self.num_pages += 1
+        self._header_dirty = True
+        self._dirty[node.page] = node
+        return node
+
+    def _put(self, node):
+        self._cache[node.page] = node
+        self._cache.move_to_end(node.page)
+        while len(self._cache) > NODE_CACHE:
+            self._cache.popitem(last=False)
+
+    def _node(self, page):
+        node = self._dirty.get(page)
+        if node is not None:
+            return node
+        node = self._cache.get(page)
+        if node is not None:
+            self._cache.move_to_end(page)
+            return node
+        node = self._decode_node(page, self.pages.read(page * PAGE_SIZE, PAGE_SIZE))
+        self._put(node)
+        return node
+
+    def _touch(self, node):
+        """Marca node como modificado (se llama después de cambiarlo)."""
+        self._cache.pop(node.page, None)
+        self._dirty[node.page] = node
+
+    def _key_bytes(self, key):
+        """Bytes de una clave de texto sin el relleno de espacios."""
+        return self._encode_key(key).rstrip(b" ")
+
+    def _key_size(self, key):
+        if self.compress_keys:
+            return self._key_len.size + len(self._key_bytes(key))
+        return self._key.size
+
+    def _entry_size(self, values, key=None):
+        """Bytes que ocupa en la hoja una entrada con esa lista de ids.
+
+        Con claves comprimidas cuenta la clave completa; el prefijo común de la
+        hoja se descuenta en _entry_sizes.
+        """
+        if isinstance(values, _Postings):
+            return self._key_size(key) + ENTRY_COUNT.size + OVERFLOW_REF.size
+        return self._key_size(key) + ENTRY_COUNT.size + len(values) * self._value.size
+
+    def _prefix(self, keys):
+        """Prefijo común (en bytes) que se guarda una vez por página."""
+        if not self.compress_keys or not keys:
+            return b""
+        return common_prefix(self._key_bytes(keys[0]), self._key_bytes(keys[-1]))
+
+    def _entry_sizes(self, node):
+        p = len(self._prefix(node.keys))
+        return [
+            self._entry_size(values, key) - p for key, values in zip(node.keys, node.values)
+        ]
+
+    def _leaf_size(self, node):
+        extra = PREFIX_LEN.size + len(self._prefix(node.keys)) if self.compress_keys else 0
+        return extra + sum(self._entry_sizes(node))
+
+    def _internal_fits(self, node):
+        if not self.compress_keys:
+            return len(node.keys) <= self.internal_capacity
+        p = len(self._prefix(node.keys))
+        size = PREFIX_LEN.size + p + len(node.children) * CHILD.size
+        size += sum(self._key_size(key) - p for key in node.keys)
+        return size <= BODY
+
+    def _separator(self, left, right):
+        """Separador entre dos nodos hermanos (left < separador <= right)."""
+        return shortest_separator(left, right) if self.compress_keys else right
+
+    def _encode_keys(self, keys):
+        """Partes codificadas de las claves de una página (con el prefijo primero)."""
+        if not self.compress_keys:
+            pack_key, ek = self._key.pack, self._encode_key
+            return [], [pack_key(ek(key)) for key in keys]
+        raw = [self._key_bytes(key) for key in keys]
+        prefix = common_prefix(raw[0], raw[-1]) if raw else b""
+        p, pack_len = len(prefix), self._key_len.pack
+        return [PREFIX_LEN.pack(p), prefix], [pack_len(len(r) - p) + r[p:] for r in raw]
+
+    def _read_prefix(self, buf, pos):
+        if not self.compress_keys:
+            return b"", pos
+        (p,) = PREFIX_LEN.unpack_from(buf, pos)
+        pos += PREFIX_LEN.size
+        return bytes(buf[pos : pos + p]), pos + p
+
+    def _read_key(self, buf, pos, prefix):
+        if not self.compress_keys:
+            return self._decode_key(self._key.unpack_from(buf, pos)[0]), pos + self._key.size
+        (n,) = self._key_len.unpack_from(buf, pos)
+        pos += self._key_len.size
+        return self._decode_key(prefix + bytes(buf[pos : pos + n])), pos + n
+
+    def _decode_node(self, page, buf):
+        kind, n, next_page = NODE_HEADER.unpack_from(buf, 0)
+        pos = NODE_HEADER.size
+        dk, dv = self._decode_key, self._decode_value
+        ks, vs = self._key.size, self._value.size
+        if kind == LEAF:
+            keys, values = [], []
+            prefix, pos = self._read_prefix(buf, pos)
+            for _ in range(n):
+                key, pos = self._read_key(buf, pos, prefix)
+                keys.append(key)
+                (size,) = ENTRY_COUNT.unpack_from(buf, pos)
+                pos += ENTRY_COUNT.size
+                if size == OVERFLOW:
+                    values.append(_Postings(*OVERFLOW_REF.unpack_from(buf, pos)))
+                    pos += OVERFLOW_REF.size
+                else:
+                    end = pos + size * vs
+                    values.append([dv(v) for (v,) in self._value.iter_unpack(buf[pos:end])])
+                    pos = end
+            return _Node(page, LEAF, keys, values, next=next_page)
+        if kind == POSTING:
+            end = pos + n * vs
+            ids = [dv(v) for (v,) in self._value.iter_unpack(buf[pos:end])]
+            return _Node(page, POSTING, values=ids, next=next_page)
+        if self.compress_keys:
+            keys = []
+            prefix, pos = self._read_prefix(buf, pos)
+            for _ in range(n):
+                key, pos = self._read_key(buf, pos, prefix)
+                keys.append(key)
+            end = pos
+        else:
+            end = pos + n * ks
+            keys = [dk(k) for (k,) in self._key.iter_unpack(buf[pos:end])]
+        children = list(struct.unpack_from(f"<{n + 1}I", buf, end))
+        return _Node(page, INTERNAL, keys, children=children)
+
+    def _encode_node(self, node):
+        n = len(node.values) if node.kind == POSTING else len(node.keys)
+        parts = [NODE_HEADER.pack(node.kind, n, node.next)]
+        ev, pack_value = self._encode_value, self._value.pack
+        if node.kind == LEAF:
+            prefix, keys = self._encode_keys(node.keys)
+            parts.extend(prefix)
+            for key, values in zip(keys, node.values):
+                parts.append(key)
+                if isinstance(values, _Postings):
+                    parts.append(ENTRY_COUNT.pack(OVERFLOW))
+                    parts.append(OVERFLOW_REF.pack(values.count, values.head))
+                else:
+                    parts.append(ENTRY_COUNT.pack(len(values)))
+                    parts.extend(pack_value(ev(v)) for v in values)
+        elif node.kind == POSTING:
+            parts.extend(pack_value(ev(v)) for v in node.values)
+        else:
+            prefix, keys = self._encode_keys(node.keys)
+            parts.extend(prefix)
+            parts.extend(keys)
+            parts.append(struct.pack(f"<{len(node.children)}I", *node.children))
+        return b"".join(parts).ljust(PAGE_SIZE, b"\0")
+
+    def _write_node(self, node):
+        self.pages.write(node.page * PAGE_SIZE, self._encode_node(node))
+
+    def flush(self):
+        """Escribe las páginas modificadas y la cabecera."""
+        with self._lock:
+            for page in sorted(self._dirty):
+                self._write_node(self._dirty[page])
+            for node in self._dirty.values():
+                self._put(node)
+            self._dirty.clear()
+            if self._header_dirty:
+                self.pages.write(0, self._header_page())
+                self._header_dirty = False
+
+    def _header_page(self):
+        header = HEADER.pack(
+            MAGIC, self.key_format.encode(), self.value_format.encode(), self.root, self.num_pages
+        )
+        flags = HEADER_FLAGS.pack(PREFIX_KEYS if self.compress_keys else 0)
+        return (header + flags).ljust(PAGE_SIZE, b"\0")
+
+    # --- posting lists ---
+
+    def _postings(self, values):
+        """Todos los ids de una entrada de hoja."""
+        if not isinstance(values, _Postings):
+            return values
+        ids = []
+        page = values.head
+        while page:
+            node = self._node(page)
+            ids.extend(node.values)
+            page = node.next
+        return ids
+
+    def _spill(self, values):
+        """Mueve la lista de ids de una entrada a páginas POSTING nuevas."""
+        cap = self.posting_capacity
+        nodes = [self._allocate(POSTING) for _ in range(0, len(values), cap)]
+        for i, node in enumerate(nodes):
+            node.values = values[i * cap : (i + 1) * cap]
+            if i + 1 < len(nodes):
+                node.next = nodes[i + 1].page
+            self._touch(node)
+        return _Postings(len(values), nodes[0].page)
+
+    def _add_posting(self, postings, value):
+        head = self._node(postings.head)
+        if len(head.values) < self.posting_capacity:
+            head.values.append(value)
+            self._touch(head)
+        else:
+            node = self._allocate(POSTING)
+            node.values = [value]
+            node.next = postings.head
+            self._touch(node)
+            postings.head = node.page
+        postings.count += 1
+
+    def _remove_posting(self, postings, value):
+        prev, page = None, postings.head
+        while page:
+            node = self._node(page)
+            if value in node.values:
+                node.values.remove(value)
+                if not node.values:
+                    # La página queda sin uso: se saca de la cadena
+                    if prev is None:
+                        postings.head = node.next
+                    else:
+                        prev.next = node.next
+                        self._touch(prev)
+                else:
+                    self._touch(node)
+                postings.count -= 1
+                return True
+            prev, page = node, node.next
+        return False
+
+    # --- consultas ---
+
+    def normalize(self, key):
+        """Clave tal como queda guardada (p. ej. float32), para comparar igual."""
+        return self._decode_key(self._key.unpack(self._key.pack(self._encode_key(key)))[0])
+
+    def _find_leaf(self, key):
+        """Hoja que contiene (o contendría) key."""
+        node = self._node(self.root)
+        while not node.is_leaf:
+            node = self._node(node.children[bisect_right(node.keys, key)])
+        return node
+
+    def search(self, key):
+        key = self.normalize(key)
+        with self._lock:
+            node = self._find_leaf(key)
+            i = bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                return list(self._postings(node.values[i]))
+            return []
+
+    def range_search(self, start_key, end_key):
+        return [value for _, value in self.cursor(start_key, end_key)]
+
+    def cursor(self, start_key=None, end_key=None, descending=False, limit=None):
+        """Recorre perezosamente (clave, valor) con start_key <= clave <= end_key.
+
+        Avanza hoja por hoja por los enlaces next (hacia atrás, con la pila de
+        la bajada, si descending) y se detiene después de limit resultados: una
+        consulta con LIMIT no lee ni arma el rango completo. None en un extremo
+        deja ese lado abierto.
+        """
+        if start_key is not None:
+            start_key = self.normalize(start_key)
+        if end_key is not None:
+            end_key = self.normalize(end_key)
+        if limit is not None and limit <= 0:
+            return
+        leaves = self._leaves_backward(end_key) if descending else self._leaves_forward(start_key)
+        produced = 0
+        for node in leaves:
+            with self._lock:
+                keys, entries = node.keys[:], node.values[:]
+            i = 0 if start_key is None else bisect_left(keys, start_key)
+            j = len(keys) if end_key is None else bisect_right(keys, end_key)
+            positions = range(j - 1, i - 1, -1) if descending else range(i, j)
+            for n in positions:
+                for value in self._iter_postings(entries[n]):
+                    yield keys[n], value
+                    produced += 1
+                    if limit is not None and produced >= limit:
+                        return
+            if (i > 0) if descending else (j < len(keys)):
+                return
+
+    def _leftmost_leaf(self):
+        node = self._node(self.root)
+        while not node.is_leaf:
+            node = self._node(node.children[0])
+        return node
+
+    def _leaves_forward(self, start_key):
+        with self._lock:
+            node = self._leftmost_leaf() if start_key is None else self._find_leaf(start_key)
+        while True:
+            yield node
+            with self._lock:
+                if not node.next:
+                    return
+                node = self._node(node.next)
+
+    def _leaves_backward(self, end_key):
+        """Hojas de derecha a izquierda desde la que contiene end_key."""
+        with self._lock:
+            stack = []  # (nodo interno, índice del hijo por el que se bajó)
+            node = self._node(self.root)
+            while not node.is_leaf:
+                i = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+                stack.append((node, i))
+                node = self._node(node.children[i])
+        yield node
+        while stack:
+            with self._lock:
+                parent, i = stack.pop()
+                if i == 0:
+                    continue
+                stack.append((parent, i - 1))
+                node = self._node(parent.children[i - 1])
+                while not node.is_leaf:
+                    stack.append((node, len(node.children) - 1))
+                    node = self._node(node.children[-1])
+            yield node
+
+    def _iter_postings(self, values):
+        """Ids de una entrada de hoja, página por página si están en páginas propias."""
+        if not isinstance(values, _Postings):
+            yield from list(values)
+            return
+        page = values.head
+        while page:
+            with self._lock:
+                node = self._node(page)
+                ids, page = node.values[:], node.next
+            yield from ids
+
+    # --- modificaciones ---
+
+    def add(self, key, value):
+        key = self.normalize(key)
+        with self._lock:
+            split = self._insert(self._node(self.root), key, value)
+            if split is not None:
+                separator, right = split
+                new_root = self._allocate(INTERNAL)
+                new_root.keys = [separator]
+                new_root.children = [self.root, right]
+                self.root = new_root.page
+
+    def _insert(self, node, key, value):
+        """Inserta en el subárbol de node; devuelve (separador, página nueva) si se dividió."""
+        if node.is_leaf:
+            i = bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                values = node.values[i]
+                if isinstance(values, _Postings):
+                    self._add_posting(values, value)
+                elif len(values) >= self.inline_limit:
+                    node.values[i] = self._spill(values + [value])
+                else:
+                    values.append(value)
+            else:
+                node.keys.insert(i, key)
+                node.values.insert(i, [value])
+            if self._leaf_size(node) <= BODY:
+                self._touch(node)
+                return None
+            return self._split_leaf(node)
+
+        i = bisect_right(node.keys, key)
+        split = self._insert(self._node(node.children[i]), key, value)
+        if split is None:
+            return None
+        separator, page = split
+        node.keys.insert(i, separator)
+        node.children.insert(i + 1, page)
+        if self._internal_fits(node):
+            self._touch(node)
+            return None
+        mid = len(node.keys) // 2
+        right = self._allocate(INTERNAL)
+        separator = node.keys[mid]
+        right.keys, node.keys = node.keys[mid + 1 :], node.keys[:mid]
+        right.children, node.children = node.children[mid + 1 :], node.children[: mid + 1]
+        self._touch(node)
+        self._touch(right)
+        return separator, right.page
+
+    def _split_leaf(self, node):
+        # Corte por bytes: las entradas tienen tamaños distintos
+        sizes = self._entry_sizes(node)
+        half = sum(sizes) / 2
+        mid, used = 0, 0
+        while mid < len(sizes) - 1 and used + sizes[mid] <= half:
+            used += sizes[mid]
+            mid += 1
+        mid = max(mid, 1)
+        right = self._allocate(LEAF)
+        right.keys, node.keys = node.keys[mid:], node.keys[:mid]
+        right.values, node.values = node.values[mid:], node.values[:mid]
+        right.next, node.next = node.next, right.page
+        self._touch(node)
+        self._touch(right)
+        return self._separator(node.keys[-1], right.keys[0]), right.page
+
+    def remove(self, key, value=None):
+        """Elimina las entradas con clave key (solo la de ese valor si se indica)."""
+        key = self.normalize(key)
+        with self._lock:
+            node = self._find_leaf(key)
+            i = bisect_left(node.keys, key)
+            if i == len(node.keys) or node.keys[i] != key:
+                return
+            values = node.values[i]
+            if value is not None:
+                if isinstance(values, _Postings):
+                    if not self._remove_posting(values, value):
+                        return
+                    remaining = values.count
+                else:
+                    if value not in values:
+                        return
+                    values.remove(value)
+                    remaining = len(values)
+                if remaining:
+                    self._touch(node)
+                    return
+            del node.keys[i]
+            del node.values[i]
+            self._touch(node)
+
+    def remap_values(self, mapping):
+        """Reemplaza cada valor v por mapping[v] en una pasada por las hojas.
+
+        Sirve para índices que guardan localizadores físicos: después de un
+        reorganize se corrigen en el lugar, sin reconstruir el árbol.
+        """
+        with self._lock:
+            node = self._leftmost_leaf()
+            while True:
+                changed = False
+                for values in node.values:
+                    if isinstance(values, _Postings):
+                        page = values.head
+                        while page:
+                            posting = self._node(page)
+                            if _remap(posting.values, mapping):
+                                self._touch(posting)
+                            page = posting.next
+                    elif _remap(values, mapping):
+                        changed = True
+                if changed:
+                    self._touch(node)
+                if not node.next:
+                    break
+                node = self._node(node.next)
+            self.flush()
+
+    # --- persistencia (misma interfaz que BPlusTree) ---
+
+    def save_to_file(self, filename=None):
+        self.flush()
+
+    @staticmethod
+    def load_from_file(filename):
+        return PagedBPlusTree.open(filename)
+
+
+def load_bplus_tree(filename):
+    """Abre un índice B+: paginado si el archivo tiene la cabecera, si no el pickle antiguo."""
+    with open(filename, "rb") as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        return PagedBPlusTree.open(filename)
+    return BPlusTree.load_from_file(filename)
@@ -12,22 +12,38 @@ from algoritmos.table_manager import (
     global_tables,
     tables_dir,
     load_all_tables,
+    attach_wal,
+)
+from algoritmos.paged_bplus_tree import LOCATOR_FORMAT, PagedBPlusTree
+from algoritmos.sequential import (
+    DEFAULT_REORGANIZE_POLICY,
+    SequentialFileManager,
+    build_producto_class,
 )
-from algoritmos.bplus_tree import BPlusTree
-from algoritmos.sequential import SequentialFileManager, build_producto_class
 from algoritmos.query_handlers import (
+    _handle_create_index,
     _handle_delete,
     _handle_insert,
+    _handle_reorganize,
     _handle_select,
     _handle_spatial_query,
 )
 from algoritmos.rtree_in import RTreeIndex, build_city_class
 from algoritmos.isam import ISAMIndex
+from algoritmos.secondary_indexes import index_key, register_index
+from algoritmos.buffer_pool import buffer_pool
 from pathlib import Path
 
 load_all_tables()
 
-bplus_tree = BPlusTree(t=3)
+
+def _select_options(items):
+    """ORDER BY / LIMIT opcionales al final de un SELECT (dicts de sus reglas)."""
+    options = {}
+    for item in items:
+        if isinstance(item, dict):
+            options.update(item)
+    return options
 
 
 class SQLTransformer(Transformer):
@@ -85,6 +101,7 @@ class SQLTransformer(Transformer):
                         "index": index_info,
                         "record_format": record_format,
                         "record_size": record_size,
+                        "reorganize": DEFAULT_REORGANIZE_POLICY,
                     },
                     f,
                     indent=2,
@@ -96,12 +113,6 @@ class SQLTransformer(Transformer):
 
             open(table_bin, "wb").close()
 
-            Producto = build_producto_class(fields, record_format)
-
-            manager = SequentialFileManager.get_or_create(
-                table_name, record_format, record_size, Producto
-            )
-
             # 5. Insertar al archivo binario
             if index_info and index_info.get("type") == "rtree":
                 City = build_city_class(fields, record_format)
@@ -135,8 +146,13 @@ class SQLTransformer(Transformer):
                     "records_loaded": num_loaded,
                 }
             else:
-                for fila in rows:
-                    producto = Producto(
+                Producto = build_producto_class(fields, record_format)
+                manager = SequentialFileManager.get_or_create(
+                    table_name, record_format, record_size, Producto
+                )
+
+                productos = (
+                    Producto(
                         fila.get("id", ""),
                         fila.get("name", "")[:50],
                         fila.get("category", "")[:30],
@@ -144,7 +160,10 @@ class SQLTransformer(Transformer):
                         fila.get("image", "")[:100],
                         fila.get("description", "")[:200],
                     )
-                    manager.insert(producto)
+                    for fila in rows
+                )
+                # Carga masiva: un solo ordenamiento y una escritura del .bin
+                registros = manager.bulk_load(productos)
 
                 global_tables[table_name] = {
                     "manager": manager,
@@ -153,61 +172,61 @@ class SQLTransformer(Transformer):
                     "record_size": record_size,
                     "bplus_tree": None,
                     "isam": None,
+                    "index": index_info,
+                    "table_name": table_name,
                 }
+                # Los índices de una versión anterior de la tabla ya no aplican
+                manager.reorganize_listeners.clear()
 
                 if index_info["type"] == "isam":
 
                     key_column = index_info["column"]
                     index_file = f"tables/index_isam_{table_name}_{key_column}"
+                    for path in (f"{index_file}.meta", f"{index_file}.data"):
+                        if os.path.exists(path):
+                            os.remove(path)
                     isam = ISAMIndex(
                         index_path=Path(f"{index_file}.meta"),
                         data_path=Path(f"{index_file}.data"),
                         leaf_capacity=128,
+                        # Claves de texto: comprimidas por prefijo en cada página
+                        compress_keys=Producto.codec.layout[key_column][1].endswith("s"),
+                        key_format=Producto.codec.layout[key_column][1],
                     )
                     print(f"Creando ISAM para {table_name} en {index_file}")
 
-                    aux_file = os.path.join(tables_dir, f"{table_name}_aux.bin")
-                    key_offset_pairs = []
-                    productos = manager._read_all(table_bin, aux_file)
-
-                    for i, producto in enumerate(productos):
-                        key = getattr(producto, key_column)
-                        offset = i * manager.record_size
-                        key_offset_pairs.append((key, offset))
-
-                    key_offset_pairs.sort()
+                    # Localizadores: el slot i (registros en el orden en disco)
+                    key_offset_pairs = [
+                        (index_key(Producto, key_column, getattr(producto, key_column)), i)
+                        for i, producto in enumerate(registros)
+                    ]
+                    key_offset_pairs.sort(key=lambda kv: kv[0])
                     isam.build(key_offset_pairs)
 
                     # Guardar en global_tables
-                    global_tables[table_name] = {
-                        "manager": manager,
-                        "producto_class": Producto,
-                        "record_format": record_format,
-                        "record_size": record_size,
-                        "isam": isam,
-                        "index": index_info,
-                    }
-
-                    return {
-                        "action": "create_from_file",
-                        "table": table_name,
-                        "file": file_path,
-                        "index": index_info,
-                        "record_format": record_format,
-                        "record_size": record_size,
-                        "isam": True,
-                    }
+                    global_tables[table_name]["isam"] = isam
+                    register_index(
+                        global_tables[table_name], {"name": key_column, **index_info}, isam
+                    )
 
                 if index_info["type"] == "bplustree":
-                    aux_file = os.path.join(tables_dir, f"{table_name}_aux.bin")
-                    for producto in manager._read_all(table_bin, aux_file):
-                        bplus_tree.add(
-                            getattr(producto, index_info["column"]), producto.id
-                        )
+                    col = index_info["column"]
+                    index_filename = f"tables/index_bplustree_{table_name}_{col}.dat"
+                    # Claves con el mismo formato struct que su columna; valores:
+                    # localizadores (el slot i, registros en el orden en disco)
+                    key_format = Producto.codec.layout[col][1]
+                    pairs = sorted(
+                        ((getattr(producto, col), i) for i, producto in enumerate(registros)),
+                        key=lambda kv: kv[0],
+                    )
+                    # Construcción masiva: una pasada, hojas llenas y enlazadas
+                    tree = PagedBPlusTree.bulk_load(
+                        index_filename, key_format, LOCATOR_FORMAT, pairs
+                    )
+                    global_tables[table_name]["bplus_tree"] = tree
+                    register_index(global_tables[table_name], {"name": col, **index_info}, tree)
 
-                    index_filename = f"tables/index_bplustree_{table_name}_{index_info['column']}.dat"
-                    bplus_tree.save_to_file(index_filename)
-                    global_tables[table_name]["bplus_tree"] = bplus_tree
+                attach_wal(table_name, replay=False)
 
                 return {
                     "action": "create_from_file",
@@ -216,7 +235,7 @@ class SQLTransformer(Transformer):
                     "index": index_info,
                     "record_format": record_format,
                     "record_size": record_size,
-                    "bplus_tree": bplus_tree,
+                    "bplus_tree": global_tables[table_name]["bplus_tree"],
                 }
 
         else:
@@ -243,6 +262,7 @@ class SQLTransformer(Transformer):
                         "columns": fields,
                         "record_format": record_format,
                         "record_size": record_size,
+                        "reorganize": DEFAULT_REORGANIZE_POLICY,
                     },
                     f,
                     indent=2,
@@ -262,13 +282,14 @@ class SQLTransformer(Transformer):
         return {"name": name, "type": dtype}
 
     def select_all(self, items):
-        return {"action": "select", "table": str(items[0])}
+        return {"action": "select", "table": str(items[0]), **_select_options(items)}
 
     def select_eq(self, items):
         return {
             "action": "select",
             "table": str(items[0]),
             "where": {"column": str(items[1]), "operator": "=", "value": items[2]},
+            **_select_options(items),
         }
 
     def select_between(self, items):
@@ -281,8 +302,15 @@ class SQLTransformer(Transformer):
                 "from": items[2],
                 "to": items[3],
             },
+            **_select_options(items),
         }
 
+    def order_clause(self, items):
+        return {"order_by": str(items[0]), "descending": items[1] == "DESC"}
+
+    def limit_clause(self, items):
+        return {"limit": int(items[0])}
+
     def select_spatial(self, items):
         table_name = str(items[0])
         spatial_condition = items[1]  # Esto viene del método spatial_condition
@@ -329,11 +357,15 @@ class SQLTransformer(Transformer):
             "where": {"column": str(items[1]), "value": items[2]},
         }
 
+    def reorganize_stmt(self, items):
+        return {"action": "reorganize", "table": str(items[0])}
+
     def index_bplustree(self, items):
         col = items[0]
         if isinstance(col, str) and col.startswith('"') and col.endswith('"'):
             col = col[1:-1]
-        return {"type": "bplustree", "column": str(col)}
+        # Las hojas guardan el localizador físico del registro (ver fetch_locators)
+        return {"type": "bplustree", "column": str(col), "values": "locator"}
 
     def index_rtree(self, items):
         x_col = str(items[0])
@@ -345,7 +377,16 @@ class SQLTransformer(Transformer):
         return {"type": "rtree", "x_column": x_col, "y_column": y_col}
 
     def index_isam(self, items):
-        return {"type": "isam", "column": str(items[0])}
+        return {"type": "isam", "column": str(items[0]), "values": "locator"}
+
+    def create_index_stmt(self, items):
+        # CREATE INDEX <nombre> ON <tabla> USING <tipo> (<columna>)
+        name, table, kind, column = (str(item) for item in items)
+        return {
+            "action": "create_index",
+            "table": table,
+            "index": {"name": name, "type": kind, "column": column, "values": "locator"},
+        }
 
     def base_type(self, items):
         return str(items[0])
@@ -407,6 +448,10 @@ def execute_query(parsed):
     elif action == "select":
         print("select")
         return _handle_select(parsed, table)
+    elif action == "reorganize":
+        return _handle_reorganize(parsed, table)
+    elif action == "create_index":
+        return _handle_create_index(parsed, table)
     elif action == "select_spatial":
         return _handle_spatial_query(parsed, table)
     elif action in ["create", "create_from_file"]:
@@ -417,9 +462,15 @@ def execute_query(parsed):
 
 
 def timed_execute_query(parsed):
+    io_before = buffer_pool.snapshot()
     start_time = time.time()
     result = execute_query(parsed)
     end_time = time.time()
     elapsed = (end_time - start_time) * 1000
 
-    return {"result": result, "execution_time_seconds": round(elapsed, 3)}
+    return {
+        "result": result,
+        "execution_time_seconds": round(elapsed, 3),
+        # Páginas leídas/escritas en disco y aciertos del buffer pool en esta consulta
+        "disk_accesses": buffer_pool.diff(io_before),
+    }
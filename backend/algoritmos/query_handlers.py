@@ -1,4 +1,13 @@
 import json
+from operator import attrgetter
+from algoritmos.secondary_indexes import (
+    INDEX_PREFERENCE,
+    build_index,
+    index_key,
+    register_index,
+    save_index_meta,
+    stores_locators,
+)
 from algoritmos.table_manager import global_tables
 
 
@@ -40,6 +49,9 @@ def _handle_delete(parsed, table):
 
     # Buscar el registro
     record = manager.search(key)
+    if record and table_type != "rtree":
+        # Antes de borrar: después ya no se puede ubicar
+        locator = manager.locate(key)
     if not record:
         entity_name = "Ciudad" if table_type == "rtree" else "Producto"
         return {
@@ -55,18 +67,10 @@ def _handle_delete(parsed, table):
             "message": f"No se pudo eliminar el registro con clave = {key}",
         }
 
-    # Actualizar B+ tree si existe (solo para tablas sequential)
+    # Actualizar los índices (solo para tablas sequential)
     if table_type != "rtree":
-        bplus_tree = table_info.get("bplus_tree")
-        index_info = table_info.get("index")
-
-        if index_info and index_info["type"] == "bplustree" and bplus_tree:
-            col_index = index_info["column"]
-            index_key = getattr(record, col_index)
-            bplus_tree.remove(index_key)
-            # Usar el nombre de la tabla en el archivo del índice
-            index_filename = f"tables/index_bplustree_{table}_{col_index}.dat"
-            bplus_tree.save_to_file(index_filename)
+        # Solo la entrada de este registro (puede haber claves repetidas)
+        _update_indexes(table_info, "remove", record, locator)
 
     entity_name = "Ciudad" if table_type == "rtree" else "Producto"
     return {
@@ -97,19 +101,10 @@ def _handle_insert(parsed, table):
     if response["status"] != 200:
         return response
 
-    # Actualizar B+ tree si existe (solo para tablas sequential)
+    # Actualizar los índices (solo para tablas sequential)
     if table_type != "rtree":
-        bplus_tree = table_info.get("bplus_tree")
-        index_info = table_info.get("index")
-
-        if index_info and index_info["type"] == "bplustree" and bplus_tree:
-            col = index_info["column"]
-            index_key = getattr(record, col)
-            record_id = getattr(record, "id") if hasattr(record, "id") else record.key
-            bplus_tree.add(index_key, record_id)
-            # Usar el nombre de la tabla en el archivo del índice
-            index_filename = f"tables/index_bplustree_{table}_{col}.dat"
-            bplus_tree.save_to_file(index_filename)
+        # insert devuelve el localizador final (puede haber disparado un reorganize)
+        _update_indexes(table_info, "add", record, response["locator"])
 
     entity_name = "Ciudad" if table_type == "rtree" else "Producto"
     record_key = record.key if hasattr(record, "key") else getattr(record, "id", "N/A")
@@ -120,7 +115,71 @@ def _handle_insert(parsed, table):
     }
 
 
+def _handle_reorganize(parsed, table):
+    """Maneja REORGANIZE TABLE: mezcla el auxiliar con el archivo principal"""
+    if table not in global_tables:
+        return {"status": 400, "message": f"Tabla '{table}' no encontrada."}
+
+    table_info = global_tables[table]
+    if table_info["index"]["type"] == "rtree":
+        return {
+            "status": 400,
+            "message": "REORGANIZE TABLE solo aplica a tablas sequential",
+        }
+
+    manager = table_info["manager"]
+    manager.reorganize()
+    return {
+        "status": 200,
+        "message": f"Tabla '{table}' reorganizada",
+        "stats": dict(manager.stats),
+    }
+
+
+def _handle_create_index(parsed, table):
+    """Maneja CREATE INDEX <nombre> ON <tabla> USING <tipo> (<columna>)"""
+    table_info = global_tables[table]
+    if (table_info.get("index") or {}).get("type") == "rtree":
+        return {
+            "status": 400,
+            "message": "CREATE INDEX solo aplica a tablas sequential",
+        }
+
+    index = parsed["index"]
+    name, col = index["name"], index["column"]
+    if col not in table_info["producto_class"].codec.names:
+        return {"status": 400, "message": f"Columna '{col}' no existe en '{table}'"}
+    if name in table_info.get("indexes", {}):
+        return {"status": 400, "message": f"El índice '{name}' ya existe en '{table}'"}
+
+    structure = build_index(table, index, table_info["manager"])
+    register_index(table_info, index, structure)
+    save_index_meta(table, index)
+    return {
+        "status": 200,
+        "message": f"Índice '{name}' ({index['type']}) creado sobre {table}.{col}",
+    }
+
+
 def _handle_select(parsed, table):
+    result = _select_records(parsed, table)
+    if not isinstance(result, list):
+        return result
+    # ORDER BY / LIMIT; los caminos por índice ya los aplicaron al recorrer
+    order_by = parsed.get("order_by")
+    if order_by:
+        try:
+            result = sorted(
+                result, key=attrgetter(order_by), reverse=parsed.get("descending", False)
+            )
+        except AttributeError:
+            return {"status": 400, "message": f"Columna '{order_by}' no existe"}
+    if parsed.get("limit") is not None:
+        result = result[: parsed["limit"]]
+    return result
+
+
+def _select_records(parsed, table):
     if table not in global_tables:
         return {"status": 400, "message": f"Tabla '{table}' no encontrada."}
 
@@ -135,22 +194,7 @@ def _handle_select(parsed, table):
             return manager._read_all(manager.data_file, manager.aux_file)
         else:  # rtree
             # Para rtree, necesitamos leer todos los registros no eliminados
-            records = []
-            if hasattr(manager, "data_file"):
-                import os
-
-                if os.path.exists(manager.data_file):
-                    with open(manager.data_file, "rb") as f:
-                        record_id = 0
-                        while True:
-                            chunk = f.read(manager.record_size)
-                            if len(chunk) < manager.record_size:
-                                break
-                            record = manager.CityClass.from_bytes(chunk)
-                            if not record.eliminado:
-                                records.append(record)
-                            record_id += 1
-            return records
+            return manager._read_all()
     cond = parsed["where"]
     col = cond["column"]
 
@@ -166,77 +210,39 @@ def _handle_select(parsed, table):
         return [city for city, distance in knn_results]
     # Búsquedas por igualdad
     if cond["operator"] == "=":
-        # Usar B+ tree si está disponible y es la columna indexada
-        bplus_tree = table_info.get("bplus_tree")
-        index_info = table_info.get("index")
-
-        if (
-            table_type != "rtree"
-            and bplus_tree
-            and index_info
-            and index_info["column"] == col
-        ):
-
-            search_value = float(cond["value"]) if col == "price" else cond["value"]
-            return bplus_tree.search(search_value)
-
-        if table_info.get("index") and table_info["index"]["type"] == "isam":
-            isam: ISAMIndex = table_info.get("isam")
-            index_column = table_info["index"]["column"]
-            print(f"Index column: {index_column}, col: {col}")
-            if col == index_column and isam:
-                key = cond["value"]
-                offset = isam.search(key)
-                if offset is not None:
-                    with open(manager.data_file, "rb") as f:
-                        f.seek(offset)
-                        chunk = f.read(manager.record_size)
-                        producto = manager.ProductoClass.from_bytes(chunk)
-                        return [] if producto.eliminado else [producto]
-                return []
+        # Usar el índice de la columna si hay uno (hash, B+ tree o ISAM)
+        index = _find_index(table_info, col, "=") if table_type != "rtree" else None
+        if index is not None:
+            return _index_lookup(table_info, index, parsed, cond["value"], cond["value"])
 
         if col in ["id", "key"]:
             result = manager.search(cond["value"])
             return [result] if result else []
 
-        if table_type != "rtree":
-            all_records = manager._read_all(manager.data_file, manager.aux_file)
-        else:  # rtree - obtener todos los registros
-            all_records = _get_all_rtree_records(manager)
-
-        return [
-            r
-            for r in all_records
-            if str(getattr(r, col, "")).strip() == str(cond["value"]).strip()
-        ]
+        # Sin índice: filtro vectorizado sobre el archivo completo
+        return manager.scan_engine.scan(
+            _table_files(manager, table_type), col, "=", cond["value"], limit=_scan_limit(parsed)
+        )
 
     # Búsquedas por rango (BETWEEN)
     elif cond["operator"] == "BETWEEN":
-        # Usar B+ tree si está disponible
-        bplus_tree = table_info.get("bplus_tree")
-        index_info = table_info.get("index")
-
-        if (
-            table_type != "rtree"
-            and bplus_tree
-            and index_info
-            and index_info["column"] == col
-        ):
-
-            from_val = float(cond["from"]) if col == "price" else cond["from"]
-            to_val = float(cond["to"]) if col == "price" else cond["to"]
-
-            ids = bplus_tree.range_search(from_val, to_val)
-            return [record for id in ids if (record := manager.search(id)) is not None]
-
-        if table_type != "rtree":
-            all_records = manager._read_all(manager.data_file, manager.aux_file)
-        else:  # rtree
-            all_records = _get_all_rtree_records(manager)
-
-        return [
-            r for r in all_records if cond["from"] <= getattr(r, col, 0) <= cond["to"]
-        ]
+        # Usar el índice de la columna si hay uno ordenado (B+ tree o ISAM)
+        index = _find_index(table_info, col, "BETWEEN") if table_type != "rtree" else None
+        if index is not None:
+            return _index_lookup(table_info, index, parsed, cond["from"], cond["to"])
+
+        if table_type != "rtree" and col == "id":
+            # El archivo principal está ordenado por id: recorrido desde el índice disperso
+            return manager.range_search(str(cond["from"]), str(cond["to"]))
+
+        return manager.scan_engine.scan(
+            _table_files(manager, table_type),
+            col,
+            "BETWEEN",
+            cond["from"],
+            cond["to"],
+            limit=_scan_limit(parsed),
+        )
 
     return {"status": 400, "message": f"Operador '{cond['operator']}' no soportado"}
 
@@ -252,22 +258,101 @@ def _extracted_from__handle_select_35(cond, manager):
     return cities_only
 
 
-def _get_all_rtree_records(manager):
-    records = []
-    if hasattr(manager, "data_file"):
-        import os
+def _index_cursor(structure, parsed, lo, hi):
+    """Valores del índice (B+ tree o ISAM) en [lo, hi], cortando en LIMIT si el orden lo permite.
+
+    El cursor recorre las hojas en orden de la clave indexada: si el ORDER BY
+    es otra columna hay que leer el rango completo y ordenar después. Devuelve
+    un generador: las hojas se leen a medida que se consumen los valores.
+    """
+    order_by = parsed.get("order_by")
+    if order_by not in (None, parsed["where"]["column"]):
+        entries = structure.cursor(lo, hi)
+    else:
+        entries = structure.cursor(
+            lo, hi, descending=parsed.get("descending", False), limit=parsed.get("limit")
+        )
+    return (value for _, value in entries)
+
+
+def _scan_limit(parsed):
+    """LIMIT que se puede aplicar durante el recorrido (sin ORDER BY)."""
+    return None if parsed.get("order_by") else parsed.get("limit")
 
-        if os.path.exists(manager.data_file):
-            with open(manager.data_file, "rb") as f:
-                while True:
-                    chunk = f.read(manager.record_size)
-                    if len(chunk) < manager.record_size:
-                        break
 
-                    record = manager.CityClass.from_bytes(chunk)
-                    if not record.eliminado:
-                        records.append(record)
-    return records
+def _find_index(table_info, col, operator):
+    """Índice de la tabla sobre col que sirve para el operador (None si no hay)."""
+    candidates = [
+        index for index in table_info.get("indexes", {}).values() if index["column"] == col
+    ]
+    for kind in INDEX_PREFERENCE.get(operator, ()):
+        for index in candidates:
+            if index["type"] == kind:
+                return index
+    return None
+
+
+def _index_lookup(table_info, index, parsed, lo, hi):
+    """Registros con lo <= columna <= hi, resueltos con el índice."""
+    manager = table_info["manager"]
+    structure = index["structure"]
+    col = index["column"]
+    if not stores_locators(index):
+        # B+ tree del formato anterior: guarda ids
+        if col == "price":
+            lo, hi = float(lo), float(hi)
+        ids = _index_cursor(structure, parsed, lo, hi)
+        return [record for id in ids if (record := manager.search(id)) is not None]
+
+    Producto = table_info["producto_class"]
+    try:
+        lo, hi = index_key(Producto, col, lo), index_key(Producto, col, hi)
+    except ValueError:
+        # El valor no se puede convertir al tipo de la columna: no hay coincidencias
+        return []
+    if index["type"] == "hash":
+        locators = structure.search(lo)
+    else:
+        locators = _index_cursor(structure, parsed, lo, hi)
+    # Una pasada por el archivo en orden de offset
+    return manager.fetch_locators(locators)
+
+
+def _update_indexes(table_info, op, record, locator):
+    """Aplica op ("add" / "remove") del registro a todos los índices de la tabla."""
+    Producto = table_info["producto_class"]
+    for index in table_info.get("indexes", {}).values():
+        col = index["column"]
+        if stores_locators(index):
+            key, value = index_key(Producto, col, getattr(record, col)), locator
+        else:
+            # B+ tree del formato anterior: claves tal cual e ids
+            key, value = getattr(record, col), record.id
+        structure = index["structure"]
+        if op == "add":
+            structure.add(key, value)
+        else:
+            structure.remove(key, value)
+        _log_index_change(table_info, op, index, key, value)
+
+
+def _log_index_change(table_info, op, index, key, value):
+    """Registra en el WAL un cambio ya aplicado al índice en memoria.
+
+    El índice se escribe a disco en el próximo checkpoint; sin WAL se guarda
+    en el momento, como antes.
+    """
+    wal = table_info.get("wal")
+    if wal is None:
+        index["structure"].save_to_file(index["file"])
+        return
+    wal.log(op, index["file"], key, value)
+
+
+def _table_files(manager, table_type):
+    if table_type == "rtree":
+        return [manager.data_file]
+    return [manager.data_file, manager.aux_file]
 
 
 def _handle_spatial_query(table, query_type, params):
@@ -0,0 +1,167 @@
+import operator
+import re
+import struct
+
+
+def field_layout(fields, record_format):
+    """Devuelve {columna: (offset, formato)} según el alineamiento nativo de struct."""
+    codes = re.findall(r"\d*[a-zA-Z?]", record_format)
+    layout = {}
+    for i, field in enumerate(fields):
+        code = codes[i]
+        offset = struct.calcsize("".join(codes[:i]) + code) - struct.calcsize(code)
+        layout[field["name"]] = (offset, code)
+    return layout
+
+
+class RecordCodec:
+    """Codificador precompilado de los registros de una tabla.
+
+    Se construye una sola vez por tabla: el formato queda compilado en un
+    struct.Struct y, a partir de los tipos de las columnas, se genera el código
+    de encode/decode (como hacen namedtuple o dataclasses), así que
+    to_bytes/from_bytes no vuelven a interpretar los tipos en cada registro.
+    """
+
+    def __init__(self, fields, record_format):
+        self.fields = fields
+        self.names = tuple(field["name"] for field in fields)
+        self.struct = struct.Struct(record_format)
+        self.size = self.struct.size
+        self.layout = field_layout(fields, record_format)
+        self.types = {field["name"]: field["type"] for field in fields}
+
+        encoders, decoders = [], []
+        for i, field in enumerate(fields):
+            tipo = field["type"]
+            if tipo.startswith("VARCHAR") or tipo == "DATE":
+                size = 10 if tipo == "DATE" else int(tipo[8:-1])
+                if tipo == "DATE":
+                    encoders.append(f"str(v[{i}])[:10].encode('utf-8').ljust(10, b' ')")
+                else:
+                    encoders.append(
+                        f"str(v[{i}]).encode('utf-8')[:{size}].ljust({size}, b' ')"
+                    )
+                decoders.append(f"v[{i}].decode('utf-8', 'replace').strip()")
+            elif tipo == "FLOAT":
+                encoders.append(f"float(v[{i}])")
+                decoders.append(f"v[{i}]")
+            elif tipo == "INT":
+                encoders.append(f"int(v[{i}])")
+                decoders.append(f"v[{i}]")
+            else:
+                raise ValueError(f"Tipo no soportado: {tipo}")
+
+        n = len(fields)
+        source = (
+            f"def encode(v, eliminado):\n"
+            f"    return pack({', '.join(encoders)}, eliminado)\n"
+            f"def decode(data):\n"
+            f"    v = unpack(data)\n"
+            f"    return ({''.join(d + ', ' for d in decoders)}), v[{n}]\n"
+        )
+        namespace = {"pack": self.struct.pack, "unpack": self.struct.unpack}
+        exec(source, namespace)  # noqa: S102
+        self.encode = namespace["encode"]  # encode(valores, eliminado) -> bytes
+        self.decode = namespace["decode"]  # decode(bytes) -> (valores, eliminado)
+
+    def encode_field(self, col, value):
+        """Bytes con los que value quedaría guardado en la columna col.
+
+        Texto: codificado y rellenado con espacios; números: empaquetados con el
+        mismo formato (float32, int32). Lanza ValueError si no se puede convertir.
+        Sirve para comparar contra los bytes del registro sin decodificarlo.
+        """
+        _, code = self.layout[col]
+        if code.endswith("s"):
+            size = int(code[:-1])
+            return str(value).strip().encode("utf-8")[:size].ljust(size, b" ")
+        try:
+            return struct.pack(code, float(value) if code == "f" else int(value))
+        except (TypeError, struct.error) as e:
+            raise ValueError(f"Valor inválido para {col}: {value!r}") from e
+
+    def normalize_field(self, col, value):
+        """value tal como se lee de vuelta de la columna col (float32, texto sin relleno).
+
+        Los índices guardan las claves así, para que el valor de una consulta
+        y el leído del registro comparen igual.
+        """
+        raw = self.encode_field(col, value)
+        code = self.layout[col][1]
+        if code.endswith("s"):
+            return raw.decode("utf-8", "replace").strip()
+        return struct.unpack(code, raw)[0]
+
+    def slots(self):
+        """__slots__ para la clase de registros (vacío si algún nombre no es válido)."""
+        if all(name.isidentifier() for name in self.names):
+            return self.names + ("eliminado",)
+        return ()
+
+
+def build_record_class(name, fields, record_format, base=object):
+    """Crea la clase de registros (Producto, City, ...) de una tabla.
+
+    Las filas usan __slots__ y se codifican con el RecordCodec de la tabla.
+    Iterar una fila da pares (columna, valor), de modo que dict(fila) sigue
+    funcionando al serializar las respuestas.
+    """
+    codec = RecordCodec(fields, record_format)
+    names = codec.names
+    attrs = names + ("eliminado",)
+    get_values = operator.attrgetter(*names) if len(names) > 1 else (
+        lambda obj: tuple(getattr(obj, n) for n in names)
+    )
+
+    if codec.slots():
+        # Asignación de todas las columnas en una sola sentencia compilada
+        namespace = {}
+        targets = "".join(f"obj.{n}, " for n in names)
+        exec(  # noqa: S102
+            f"def fill(obj, values, eliminado):\n"
+            f"    {targets}= values\n"
+            f"    obj.eliminado = eliminado\n",
+            namespace,
+        )
+        fill = namespace["fill"]
+    else:
+
+        def fill(obj, values, eliminado):
+            for field_name, value in zip(names, values):
+                setattr(obj, field_name, value)
+            obj.eliminado = eliminado
+
+    def __init__(self, *args):
+        for field_name, value in zip(names, args):
+            setattr(self, field_name, value)
+        self.eliminado = False
+
+    def to_bytes(self):
+        return codec.encode(get_values(self), self.eliminado)
+
+    @classmethod
+    def from_bytes(cls, data):
+        obj = cls.__new__(cls)
+        fill(obj, *codec.decode(data))
+        return obj
+
+    def __iter__(self):
+        for attr in attrs:
+            yield attr, getattr(self, attr, None)
+
+    def __str__(self):
+        values = [f"{n}={getattr(self, n)}" for n in names]
+        return f"[{'X' if self.eliminado else ' '}] {name}(" + ", ".join(values) + ")"
+
+    namespace = {
+        "__slots__": codec.slots(),
+        "__fields__": fields,
+        "codec": codec,
+        "__init__": __init__,
+        "to_bytes": to_bytes,
+        "from_bytes": from_bytes,
+        "__iter__": __iter__,
+        "__str__": __str__,
+    }
+    return type(name, (base,), namespace)
@@ -1,87 +1,40 @@
 import rtree
 from rtree import index
 import math
-import struct
 import os
 import pandas as pd
 import numpy as np
 from typing import List, Tuple, Any, Optional
 from collections import defaultdict
+from algoritmos.buffer_pool import PagedFile
+from algoritmos.record_codec import build_record_class
+from algoritmos.scan_engine import ScanEngine
 
 csv_f = "/Volumes/externo/proyecto1_bd2/backend/worldcities.csv"
 
+class CityBase:
+    __slots__ = ()
+
+    @property
+    def key(self):
+        # Crear una clave única basada en nombre y país
+        name = getattr(self, 'name', 'Unknown')
+        country = getattr(self, 'country', 'Unknown')
+        return f"{name}_{country}"
+
+    @property
+    def x(self):
+        # Coordenada X (longitud)
+        return float(getattr(self, 'longitude', 0.0))
+
+    @property
+    def y(self):
+        # Coordenada Y (latitud)
+        return float(getattr(self, 'latitude', 0.0))
+
+
 def build_city_class(fields, record_format):
-    class City:
-        __fields__ = fields  # Agregar esta línea para que sea accesible
-        
-        def __init__(self, *args):
-            for field, value in zip(fields, args):
-                name = field["name"]
-                setattr(self, name, value)
-            self.eliminado = False
-        
-        @property
-        def key(self):
-            # Crear una clave única basada en nombre y país
-            name = getattr(self, 'name', 'Unknown')
-            country = getattr(self, 'country', 'Unknown')
-            return f"{name}_{country}"
-        
-        @property
-        def x(self):
-            # Coordenada X (longitud)
-            return float(getattr(self, 'longitude', 0.0))
-        
-        @property
-        def y(self):
-            # Coordenada Y (latitud)
-            return float(getattr(self, 'latitude', 0.0))
-
-        def to_bytes(self):
-            valores = []
-            for field in fields:
-                val = getattr(self, field["name"])
-                fmt = field["type"]
-                if fmt.startswith("VARCHAR"):
-                    size = int(fmt[8:-1])
-                    val = str(val).encode("utf-8")[:size].ljust(size, b" ")
-                    valores.append(val)
-                elif fmt == "FLOAT":
-                    valores.append(float(val))
-                elif fmt == "INT":
-                    valores.append(int(val))
-                elif fmt == "DATE":
-                    val = str(val)[:10].encode("utf-8").ljust(10, b" ")
-                    valores.append(val)
-            valores.append(self.eliminado)
-            return struct.pack(record_format, *valores)
-
-        @staticmethod
-        def from_bytes(data):
-            unpacked = struct.unpack(record_format, data)
-            parsed = []
-            for val, field in zip(unpacked[:-1], fields):
-                tipo = field["type"]
-                if tipo.startswith("VARCHAR") or tipo == "DATE":
-                    parsed.append(val.decode("utf-8", errors="replace").strip())
-                elif tipo == "FLOAT":
-                    parsed.append(float(val))
-                elif tipo == "INT":
-                    parsed.append(int(val))
-            eliminado = unpacked[-1]
-            obj = City(*parsed)
-            obj.eliminado = eliminado
-            return obj
-
-        def __str__(self):
-            values = [f"{f['name']}={getattr(self, f['name'])}" for f in fields]
-            return (
-                f"[{'X' if self.eliminado else ' '}] City("
-                + ", ".join(values)
-                + ")"
-            )
-
-    return City
+    return build_record_class("City", fields, record_format, base=CityBase)
 
 
 class RTreeIndex:
@@ -94,6 +47,10 @@ class RTreeIndex:
         self.data_file = data_file
         self.index_file = index_file
         self.dimension = dimension
+        self.owner = os.path.splitext(os.path.basename(data_file))[0]
+        self.scan_engine = ScanEngine(
+            CityClass, record_format, self.record_size, owner=self.owner
+        )
         
         # Crear directorio si no existe
         os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
@@ -101,6 +58,7 @@ class RTreeIndex:
         # Inicializar archivos si no existen
         if not os.path.exists(self.data_file):
             open(self.data_file, "wb").close()
+        self.data_map = PagedFile(self.data_file, self.record_size, self.owner)
         
         # Limpiar archivos de índice existentes para evitar corrupción
         self._cleanup_index_files()
@@ -302,11 +260,9 @@ class RTreeIndex:
     def _read_record_by_position(self, position):
         """Lee un registro específico por su posición en el archivo"""
         try:
-            with open(self.data_file, "rb") as f:
-                f.seek(position * self.record_size)
-                chunk = f.read(self.record_size)
-                if len(chunk) == self.record_size:
-                    return self.CityClass.from_bytes(chunk)
+            chunk = self.data_map.record(position)
+            if chunk is not None:
+                return self.CityClass.from_bytes(chunk)
         except Exception as e:
             print(f"⚠️ Error leyendo registro en posición {position}: {e}")
         return None
@@ -328,8 +284,7 @@ class RTreeIndex:
         
         try:
             # Agregar al archivo binario
-            with open(self.data_file, "ab") as f:
-                f.write(city.to_bytes())
+            self.data_map.append(city.to_bytes())
             
             # Agregar al índice espacial
             bbox = coords + coords
@@ -371,9 +326,7 @@ class RTreeIndex:
                     city.eliminado = True
                     
                     # Actualizar en el archivo
-                    with open(self.data_file, "r+b") as f:
-                        f.seek(record_id * self.record_size)
-                        f.write(city.to_bytes())
+                    self.data_map.write(record_id * self.record_size, city.to_bytes())
                     
                     # Remover del índice espacial
                     coords = self._extract_coordinates(city)
@@ -432,6 +385,7 @@ class RTreeIndex:
         
         except Exception as e:
             print(f"❌ Error en inserción por lotes: {e}")
+        self.data_map.rewritten(successful_inserts * self.record_size)
         
         print(f"✅ Agregadas {successful_inserts}/{len(cities)} ciudades exitosamente")
         return ids
@@ -492,7 +446,31 @@ class RTreeIndex:
     def knn_search(self, point: List[float], k: int) -> List[Tuple[Any, float]]:
         if not self._validate_coordinates(point):
             return []
-            
+
+        try:
+            best = []
+            for rows in self.scan_engine.chunks(self.data_file):
+                xs = self.scan_engine.numeric(rows, "longitude")
+                ys = self.scan_engine.numeric(rows, "latitude")
+                valid = (
+                    self.scan_engine.mask(rows)
+                    & np.isfinite(xs) & np.isfinite(ys)
+                    & (np.abs(xs) <= 180) & (np.abs(ys) <= 90)
+                )
+                positions = np.flatnonzero(valid)
+                distances = _haversine_vectorized(point, xs[positions], ys[positions])
+                # Solo se materializan los k más cercanos de cada bloque
+                top = np.argsort(distances, kind="stable")[:k]
+                cities = self.scan_engine.materialize(rows, positions[top])
+                best.extend(zip(cities, distances[top].tolist()))
+            best.sort(key=lambda x: x[1])
+            return best[:k]
+        except ValueError as e:
+            # Coordenadas guardadas como texto no numérico: recorrido registro a registro
+            print(f"KNN vectorizado no disponible ({e}), usando recorrido secuencial")
+            return self._knn_search_scan(point, k)
+
+    def _knn_search_scan(self, point: List[float], k: int) -> List[Tuple[Any, float]]:
         distances = []
         try:
             with open(self.data_file, "rb") as f:
@@ -547,50 +525,30 @@ class RTreeIndex:
             return float('inf')
 
     def size(self) -> int:
-        count = 0
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, "rb") as f:
-                    while True:
-                        chunk = f.read(self.record_size)
-                        if len(chunk) < self.record_size:
-                            break
-                        
-                        try:
-                            city = self.CityClass.from_bytes(chunk)
-                            if not city.eliminado:
-                                count += 1
-                        except Exception:
-                            continue
-            except Exception as e:
-                print(f"❌ Error contando registros: {e}")
-        return count
+        # Basta con el byte de eliminado: no hace falta decodificar los registros
+        return sum(1 for _, chunk in self.data_map.records() if not chunk[-1])
 
     def _read_all(self, include_deleted=False):
         registros = []
-        
-        if not os.path.exists(self.data_file) or os.path.getsize(self.data_file) == 0:
-            return registros
-        
-        try:
-            with open(self.data_file, "rb") as f:
-                while True:
-                    chunk = f.read(self.record_size)
-                    if len(chunk) < self.record_size:
-                        break
-                    
-                    try:
-                        city = self.CityClass.from_bytes(chunk)
-                        if not city.eliminado or include_deleted:
-                            registros.append(city)
-                    except Exception:
-                        continue
-        except Exception as e:
-            print(f"❌ Error leyendo todos los registros: {e}")
-        
+        for _, chunk in self.data_map.records():
+            if chunk[-1] and not include_deleted:
+                continue
+            try:
+                registros.append(self.CityClass.from_bytes(chunk))
+            except Exception:
+                continue
         return registros
 
 
+def _haversine_vectorized(point, lons, lats):
+    """Distancia Haversine (km) desde point a cada (lons[i], lats[i])."""
+    lon1, lat1 = math.radians(float(point[0])), math.radians(float(point[1]))
+    lon2, lat2 = np.radians(lons), np.radians(lats)
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
 def load_cities_from_csv(csv_file: str, rtree_index: RTreeIndex):
     try:
         print(f"📖 Leyendo archivo CSV: {csv_file}")
@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+
+from algoritmos.buffer_pool import buffer_pool, count_pages
+from algoritmos.record_codec import field_layout
+
+CHUNK_RECORDS = 65536  # registros por bloque al recorrer archivos grandes
+
+
+def build_dtype(fields, record_format, record_size):
+    """dtype estructurado de NumPy equivalente a record_format (mismos offsets)."""
+    names, formats, offsets = [], [], []
+    for name, (offset, code) in field_layout(fields, record_format).items():
+        if code.endswith("s"):
+            formats.append(f"S{code[:-1]}")
+        elif code == "f":
+            formats.append("=f4")
+        elif code == "i":
+            formats.append("=i4")
+        else:
+            raise ValueError(f"Formato no soportado: {code}")
+        names.append(name)
+        offsets.append(offset)
+    names.append("eliminado")
+    formats.append("?")
+    offsets.append(record_size - 1)
+    return np.dtype(
+        {"names": names, "formats": formats, "offsets": offsets, "itemsize": record_size}
+    )
+
+
+class ScanEngine:
+    """Recorre archivos de registros de ancho fijo y evalúa el WHERE con máscaras.
+
+    Los registros se leen por bloques con np.memmap y solo las filas que cumplen
+    el predicado se convierten en objetos (Producto, City, ...). Los recorridos
+    no pasan por el buffer pool, pero sus páginas se cuentan a nombre de owner.
+    """
+
+    def __init__(self, RecordClass, record_format, record_size, owner=None):
+        self.RecordClass = RecordClass
+        self.record_size = int(record_size)
+        self.owner = owner
+        self.types = {f["name"]: f["type"] for f in RecordClass.__fields__}
+        self.dtype = build_dtype(RecordClass.__fields__, record_format, self.record_size)
+
+    def chunks(self, filename):
+        if not os.path.exists(filename):
+            return
+        count = os.path.getsize(filename) // self.record_size
+        if count == 0:
+            return
+        if self.owner is not None:
+            buffer_pool.count(self.owner, reads=count_pages(count * self.record_size))
+        rows = np.memmap(filename, dtype=self.dtype, mode="r", shape=(count,))
+        for start in range(0, count, CHUNK_RECORDS):
+            yield rows[start : start + CHUNK_RECORDS]
+
+    def _encode(self, col, value):
+        """Valor de la consulta tal como está guardado en la columna."""
+        raw = self.RecordClass.codec.encode_field(col, value)
+        return np.frombuffer(raw, dtype=self.dtype.fields[col][0])[0]
+
+    def mask(self, rows, col=None, operator=None, value=None, to=None):
+        live = ~rows["eliminado"]
+        if col is None:
+            return live
+        if col not in self.types:
+            return np.zeros(len(rows), dtype=bool)
+        try:
+            if operator == "=":
+                return live & (rows[col] == self._encode(col, value))
+            if operator == "BETWEEN":
+                column = rows[col]
+                lo, hi = self._encode(col, value), self._encode(col, to)
+                return live & (column >= lo) & (column <= hi)
+        except (TypeError, ValueError):
+            # El valor no se puede convertir al tipo de la columna: no hay coincidencias
+            return np.zeros(len(rows), dtype=bool)
+        raise ValueError(f"Operador '{operator}' no soportado")
+
+    def materialize(self, rows, positions):
+        return [
+            self.RecordClass.from_bytes(rows[i : i + 1].tobytes()) for i in positions
+        ]
+
+    def numeric(self, rows, col, default=0.0):
+        """Columna como float64 (también si está guardada como VARCHAR)."""
+        if col not in self.types:
+            return np.full(len(rows), default)
+        column = rows[col]
+        if column.dtype.kind == "S":
+            column = np.char.strip(column)
+        return column.astype(np.float64)
+
+    def scan(self, filenames, col=None, operator=None, value=None, to=None, limit=None):
+        """Devuelve los registros vivos de filenames que cumplen col <operator> value.
+
+        Sin columna devuelve todos los registros vivos. Con limit deja de leer
+        bloques en cuanto junta esa cantidad.
+        """
+        result = []
+        for filename in filenames:
+            for rows in self.chunks(filename):
+                hits = np.flatnonzero(self.mask(rows, col, operator, value, to))
+                if limit is not None:
+                    hits = hits[: limit - len(result)]
+                result.extend(self.materialize(rows, hits))
+                if limit is not None and len(result) >= limit:
+                    return result
+        return result
@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+from operator import itemgetter
+from pathlib import Path
+
+from algoritmos.extendible_hashing import ExtendibleHashing
+from algoritmos.isam import ISAMIndex
+from algoritmos.paged_bplus_tree import LOCATOR_FORMAT, PagedBPlusTree, load_bplus_tree
+from algoritmos.sequential import AUX_LOCATOR
+
+# Tipos de índice que acepta CREATE INDEX ... USING <tipo> (col)
+INDEX_TYPES = ("bplustree", "isam", "hash")
+# Índice preferido para cada operador del WHERE (hash solo sirve para igualdad)
+INDEX_PREFERENCE = {"=": ("hash", "bplustree", "isam"), "BETWEEN": ("bplustree", "isam")}
+ISAM_LEAF_CAPACITY = 128
+HASH_BUCKET_SIZE = 64
+
+tables_dir = "tables"
+
+
+def index_file(table_name, index):
+    """Archivo del índice: tables/index_<tipo>_<tabla>_<nombre>[.dat].
+
+    El índice de CREATE TABLE ... USING INDEX se llama como su columna, así
+    conserva el nombre de archivo que ya tenía.
+    """
+    base = os.path.join(tables_dir, f"index_{index['type']}_{table_name}_{index['name']}")
+    return base + ".dat" if index["type"] == "bplustree" else base
+
+
+def stores_locators(index):
+    """True si el índice guarda localizadores físicos en vez de ids u offsets."""
+    return bool(index) and index.get("values") == "locator"
+
+
+def index_key(ProductoClass, col, value):
+    """Clave de índice para value: tal como queda guardada en la columna."""
+    return ProductoClass.codec.normalize_field(col, value)
+
+
+def live_pairs(manager, col):
+    """(clave, localizador) de los registros vivos de la tabla, ordenados por clave."""
+    pairs = []
+    for tag, pages in ((0, manager.data_map), (AUX_LOCATOR, manager.aux_map)):
+        for slot, chunk in pages.records():
+            if not chunk[-1]:
+                record = manager.ProductoClass.from_bytes(chunk)
+                pairs.append((getattr(record, col), tag | slot))
+    pairs.sort(key=itemgetter(0))
+    return pairs
+
+
+def _isam(filename, key_format, compress_keys=False):
+    # Un ISAM ya existente conserva la compresión con que se construyó
+    return ISAMIndex(
+        index_path=Path(f"{filename}.meta"),
+        data_path=Path(f"{filename}.data"),
+        leaf_capacity=ISAM_LEAF_CAPACITY,
+        compress_keys=compress_keys,
+        key_format=key_format,
+    )
+
+
+def _hash(filename):
+    return ExtendibleHashing(bucket_size=HASH_BUCKET_SIZE, data_dir=filename)
+
+
+def build_index(table_name, index, manager):
+    """Construye el índice desde cero con los registros vivos de la tabla."""
+    col = index["column"]
+    filename = index_file(table_name, index)
+    pairs = live_pairs(manager, col)
+    key_format = manager.ProductoClass.codec.layout[col][1]
+    if index["type"] == "bplustree":
+        # bulk_load comprime las claves de texto por prefijo
+        return PagedBPlusTree.bulk_load(filename, key_format, LOCATOR_FORMAT, pairs)
+    if index["type"] == "isam":
+        for path in (f"{filename}.meta", f"{filename}.data"):
+            if os.path.exists(path):
+                os.remove(path)
+        isam = _isam(filename, key_format, compress_keys=key_format.endswith("s"))
+        isam.build(pairs)
+        return isam
+    shutil.rmtree(filename, ignore_errors=True)
+    hashing = _hash(filename)
+    for key, locator in pairs:
+        hashing.add(key, locator)
+    hashing.flush()
+    return hashing
+
+
+def open_index(table_name, index, manager):
+    """Abre un índice existente; lo reconstruye si falta o es del formato anterior."""
+    filename = index_file(table_name, index)
+    if index["type"] == "bplustree":
+        if not os.path.exists(filename):
+            return None
+        return load_bplus_tree(filename)
+    if not stores_locators(index) or not os.path.exists(
+        f"{filename}.meta" if index["type"] == "isam" else filename
+    ):
+        # ISAM con offsets de bytes (no sirven para registros del auxiliar)
+        index["values"] = "locator"
+        return build_index(table_name, index, manager)
+    if index["type"] == "isam":
+        return _isam(filename, manager.ProductoClass.codec.layout[index["column"]][1])
+    return _hash(filename)
+
+
+def register_index(table_info, index, structure):
+    """Agrega el índice a table_info["indexes"] y lo engancha a reorganize y al WAL."""
+    table_name = table_info["table_name"]
+    manager = table_info["manager"]
+    filename = index_file(table_name, index)
+    table_info.setdefault("indexes", {})[index["name"]] = {
+        **index,
+        "file": filename,
+        "structure": structure,
+    }
+    if stores_locators(index):
+        # Tras un reorganize se corrigen los localizadores que cambiaron, sin reconstruir
+        manager.reorganize_listeners[filename] = structure.remap_values
+    wal = table_info.get("wal")
+    if wal is not None:
+        wal.indexes[filename] = structure
+        # El checkpoint del WAL va después de los listeners de los índices
+        manager.reorganize_listeners[wal.path] = manager.reorganize_listeners.pop(wal.path)
+
+
+def table_indexes(meta):
+    """Descriptores de índices de una tabla sequential según su .meta.json.
+
+    El índice de CREATE TABLE ... USING INDEX ("index") va primero, con el
+    nombre de su columna; luego los de CREATE INDEX ("indexes").
+    """
+    indexes = []
+    primary = meta.get("index")
+    if primary and primary.get("type") in INDEX_TYPES:
+        indexes.append({"name": primary["column"], **primary})
+    indexes.extend(meta.get("indexes", []))
+    return indexes
+
+
+def save_index_meta(table_name, index):
+    """Agrega el descriptor del índice a "indexes" en el .meta.json de la tabla."""
+    meta_path = os.path.join(tables_dir, f"{table_name}.meta.json")
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    meta.setdefault("indexes", []).append(index)
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
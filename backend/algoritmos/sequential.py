@@ -1,6 +1,14 @@
 import struct
 import os
+import json
 import time
+import heapq
+import itertools
+from bisect import bisect_right
+
+from algoritmos.buffer_pool import PagedFile, buffer_pool, count_pages
+from algoritmos.record_codec import build_record_class, field_layout
+from algoritmos.scan_engine import ScanEngine
 
 
 # RECORD FORMAT = "32s50s30sf100s200s"
@@ -9,78 +17,95 @@ import time
 # AUX FILE = "auxiliar.bin"
 CSV_FILE =  "/Users/lvera/OneDrive/Escritorio/proyecto_bd/proyecto1_bd2-main (1)/proyecto1_bd2-main/backend/productos_amazon.csv"
 K = 5
+# Política de reorganización por defecto (se guarda en "reorganize" del .meta.json):
+#   "ratio":  reorganiza cuando el auxiliar llega a ratio * registros del principal
+#             (y al menos min_records registros)
+#   "bytes":  reorganiza cuando el auxiliar supera max_aux_bytes
+#   "manual": solo con REORGANIZE TABLE
+DEFAULT_REORGANIZE_POLICY = {
+    "mode": "ratio",
+    "ratio": 0.1,
+    "min_records": K,
+    "max_aux_bytes": 1 << 20,
+}
+BLOCK_SIZE = 32  # registros por bloque del índice disperso
+DELETED_FLAG = struct.pack("?", True)  # último byte ("?") de cada registro
+# Localizador físico de un registro: su slot en el archivo principal, o el
+# slot en el auxiliar con este bit encendido (lo guardan los índices secundarios)
+AUX_LOCATOR = 1 << 62
 
 
 def build_producto_class(fields, record_format):
-    class Producto:
-        def __init__(self, *args):
-            for field, value in zip(fields, args):
-                name = field["name"]
-                setattr(self, name, value)
-            self.eliminado = False
-
-        def to_bytes(self):
-            valores = []
-            for field in fields:
-                val = getattr(self, field["name"])
-                fmt = field["type"]
-                if fmt.startswith("VARCHAR"):
-                    size = int(fmt[8:-1])
-                    val = val.encode("utf-8")[:size].ljust(size, b" ")
-                    valores.append(val)
-                elif fmt == "FLOAT":
-                    valores.append(float(val))
-                elif fmt == "INT":
-                    valores.append(int(val))
-                elif fmt == "DATE":
-                    val = str(val)[:10].encode("utf-8").ljust(10, b" ")
-                    valores.append(val)
-            valores.append(self.eliminado)
-            return struct.pack(record_format, *valores)
-
-        @staticmethod
-        def from_bytes(data):
-            unpacked = struct.unpack(record_format, data)
-            parsed = []
-            for val, field in zip(unpacked[:-1], fields):
-                tipo = field["type"]
-                if tipo.startswith("VARCHAR") or tipo == "DATE":
-                    parsed.append(val.decode("utf-8", errors="replace").strip())
-                elif tipo == "FLOAT":
-                    parsed.append(float(val))
-                elif tipo == "INT":
-                    parsed.append(int(val))
-            eliminado = unpacked[-1]
-            obj = Producto(*parsed)
-            obj.eliminado = eliminado
-            return obj
-
-        def __str__(self):
-            values = [f"{f['name']}={getattr(self, f['name'])}" for f in fields]
-            return (
-                f"[{'X' if self.eliminado else ' '}] Producto("
-                + ", ".join(values)
-                + ")"
-            )
-
-    return Producto
+    return build_record_class("Producto", fields, record_format)
 
 
 class SequentialFileManager:
     _instances = {}  # almacena una instancia por nombre de tabla
 
-    def __init__(self, record_size, record_format, data_file, aux_file, ProductoClass):
+    def __init__(
+        self,
+        record_size,
+        record_format,
+        data_file,
+        aux_file,
+        ProductoClass,
+        reorganize_policy=None,
+    ):
         self.record_size = int(record_size)
         self.record_format = record_format
         self.ProductoClass = ProductoClass
         self.data_file = data_file
         self.aux_file = aux_file
+        self.free_file = os.path.splitext(data_file)[0] + "_free.json"
         os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
 
         for file in [self.data_file, self.aux_file]:
             if not os.path.exists(file):
                 open(file, "wb").close()
 
+        # Lecturas por slot a través del buffer pool; los accesos se cuentan
+        # a nombre de la tabla
+        self.owner = os.path.splitext(os.path.basename(data_file))[0]
+        self.data_map = PagedFile(self.data_file, self.record_size, self.owner)
+        self.aux_map = PagedFile(self.aux_file, self.record_size, self.owner)
+
+        # Slots marcados como eliminados en cada archivo. Los del auxiliar se
+        # reutilizan en insert; los del principal se compactan en reorganize.
+        self.free_slots = {"data": [], "aux": []}
+        if os.path.exists(self.free_file):
+            with open(self.free_file, "r") as f:
+                self.free_slots = json.load(f)
+
+        self.reorganize_policy = {**DEFAULT_REORGANIZE_POLICY, **(reorganize_policy or {})}
+        self.stats = {"reorganizations": 0, "bytes_rewritten": 0}
+
+        # Permite leer el id directamente de los bytes sin decodificar el
+        # registro. Las tablas sin columna id (p. ej. cargadas de un CSV con
+        # otro esquema) no tienen orden por id: se decodifica como antes y no
+        # se construyen el índice disperso ni aux_index.
+        layout = field_layout(ProductoClass.__fields__, record_format)
+        self.has_id = "id" in layout
+        if self.has_id:
+            id_offset, id_code = layout["id"]
+            self._id_offset = id_offset
+            self._id_struct = struct.Struct(id_code)
+        self.scan_engine = ScanEngine(
+            ProductoClass, record_format, self.record_size, owner=self.owner
+        )
+
+        # Índice disperso: primer id de cada bloque de BLOCK_SIZE registros
+        # del archivo principal (que siempre está ordenado por id).
+        self.sparse_index = []
+        self._build_sparse_index()
+
+        # id -> slot de los registros vivos del auxiliar
+        self.aux_index = {}
+        self._build_aux_index()
+
+        # Índices con localizadores: se llaman con {localizador viejo: nuevo}
+        # después de cada reorganize (nombre del índice -> función)
+        self.reorganize_listeners = {}
+
     @classmethod
     def get_or_create(cls, table_name, record_format, record_size, ProductoClass):
         if table_name in cls._instances:
@@ -92,10 +117,120 @@ class SequentialFileManager:
             if not os.path.exists(file):
                 open(file, "wb").close()
 
-        instance = cls(record_size, record_format, data_file, aux_file, ProductoClass)
+        reorganize_policy = None
+        meta_file = os.path.join("tables", f"{table_name}.meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file, "r") as f:
+                reorganize_policy = json.load(f).get("reorganize")
+
+        instance = cls(
+            record_size,
+            record_format,
+            data_file,
+            aux_file,
+            ProductoClass,
+            reorganize_policy,
+        )
         cls._instances[table_name] = instance
         return instance
 
+    def _record_count(self, filename):
+        if not os.path.exists(filename):
+            return 0
+        return os.path.getsize(filename) // self.record_size
+
+    def _key_from_bytes(self, chunk):
+        if not self.has_id:
+            return getattr(self.ProductoClass.from_bytes(chunk), "id", None)
+        val = self._id_struct.unpack_from(chunk, self._id_offset)[0]
+        if isinstance(val, bytes):
+            return val.decode("utf-8", errors="replace").strip()
+        return val
+
+    def _iter_live_raw(self, f, tag=0):
+        """Recorre un archivo abierto y entrega (id, bytes, localizador) de los registros vivos."""
+        slot = 0
+        while True:
+            chunk = f.read(self.record_size)
+            if len(chunk) < self.record_size:
+                break
+            if not chunk[-1]:
+                yield self._key_from_bytes(chunk), chunk, tag | slot
+            slot += 1
+
+    def _build_sparse_index(self):
+        if not self.has_id:
+            self.sparse_index = []
+            return
+        self.sparse_index = [
+            self._key_from_bytes(self.data_map.record(pos))
+            for pos in range(0, len(self.data_map), BLOCK_SIZE)
+        ]
+
+    def _search_data_file(self, id):
+        """Búsqueda binaria en el archivo principal usando el índice disperso.
+
+        Devuelve (posición, producto) o (None, None) si el id no está.
+        """
+        block = bisect_right(self.sparse_index, id) - 1
+        if block < 0:
+            return None, None
+
+        lo = block * BLOCK_SIZE
+        hi = min(lo + BLOCK_SIZE, len(self.data_map)) - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            chunk = self.data_map.record(mid)
+            key = self._key_from_bytes(chunk)
+            if key == id:
+                return mid, self.ProductoClass.from_bytes(chunk)
+            if key < id:
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return None, None
+
+    def _build_aux_index(self):
+        if not self.has_id:
+            self.aux_index = {}
+            return
+        self.aux_index = {
+            self._key_from_bytes(chunk): slot
+            for slot, chunk in self.aux_map.records()
+            if not chunk[-1]
+        }
+
+    def _search_aux_file(self, id):
+        """Busca en el auxiliar con aux_index; devuelve (slot, producto) o (None, None)."""
+        slot = self.aux_index.get(id)
+        if slot is None:
+            return None, None
+        return slot, self.ProductoClass.from_bytes(self.aux_map.record(slot))
+
+    def _should_reorganize(self):
+        policy = self.reorganize_policy
+        mode = policy["mode"]
+        if mode == "manual":
+            return False
+        if mode == "bytes":
+            return os.path.getsize(self.aux_file) >= policy["max_aux_bytes"]
+        aux_records = len(self.aux_index)
+        threshold = policy["ratio"] * self._record_count(self.data_file)
+        return aux_records >= max(policy["min_records"], threshold)
+
+    def _save_free_slots(self):
+        with open(self.free_file, "w") as f:
+            json.dump(self.free_slots, f)
+
+    def _reset_free_slots(self):
+        self.free_slots = {"data": [], "aux": []}
+        self._save_free_slots()
+
+    def read_at(self, offset):
+        """Registro del archivo principal en el offset dado (None si no existe)."""
+        chunk = self.data_map.read(offset, self.record_size)
+        return self.ProductoClass.from_bytes(chunk) if chunk is not None else None
+
     def _read_all(self, filename, aux_filename=None):
 
         productos = []
@@ -105,7 +240,13 @@ class SequentialFileManager:
         if aux_filename:
             files_to_read.append(aux_filename)
 
+        maps = {self.data_file: self.data_map, self.aux_file: self.aux_map}
         for file in files_to_read:
+            if file in maps:
+                for _, chunk in maps[file].records():
+                    if not chunk[-1]:
+                        productos.append(self.ProductoClass.from_bytes(chunk))
+                continue
             if not os.path.exists(file):
                 continue
             with open(file, "rb") as f:
@@ -119,66 +260,203 @@ class SequentialFileManager:
         return productos
 
     def insert(self, producto):
-        if self.search(producto.id):
+        if self.has_id and self.search(producto.id):
             return {
                 "message": f"Ya existe un registro con ID {producto.id}",
                 "status": 400,
             }
-        with open(self.aux_file, "ab") as aux:
-            aux.write(producto.to_bytes())
+        if self.free_slots["aux"]:
+            # Reutilizar un hueco dejado por un delete en el auxiliar
+            slot = self.free_slots["aux"].pop()
+            self.aux_map.write(slot * self.record_size, producto.to_bytes())
+            self._save_free_slots()
+        else:
+            slot = self.aux_map.append(producto.to_bytes()) // self.record_size
+        if self.has_id:
+            self.aux_index[producto.id] = slot
+
+        # Localizador del registro nuevo, ya corregido si el insert reorganizó
+        locator = AUX_LOCATOR | slot
+        if self._should_reorganize():
+            locator = self.reorganize().get(locator, locator)
+        return {"message": "Registro insertado", "status": 200, "locator": locator}
+
+    def bulk_load(self, productos):
+        """Carga masiva para CREATE TABLE ... FROM FILE.
+
+        Reemplaza el contenido de la tabla: deduplica por id (como en insert,
+        se queda el primero), ordena una sola vez y escribe el archivo
+        principal en una pasada, dejando el auxiliar vacío. Devuelve los
+        registros en el orden en que quedaron en disco.
+        """
+        if self.has_id:
+            unicos = {}
+            for producto in productos:
+                unicos.setdefault(producto.id, producto)
+            registros = sorted(unicos.values(), key=lambda v: v.id)
+        else:
+            # Sin columna id no hay clave de orden: se conserva el del archivo
+            registros = list(productos)
+
+        with open(self.data_file, "wb", buffering=1 << 20) as f:
+            f.writelines(v.to_bytes() for v in registros)
+            written = f.tell()
 
-        if os.path.getsize(self.aux_file) // self.record_size >= K:
-            self.reorganize()
-        return {"message": "Registro insertado", "status": 200}
+        open(self.aux_file, "wb").close()
+        self.data_map.rewritten(written)
+        self.aux_map.invalidate()
+        self.aux_index = {}
+        self._reset_free_slots()
+        self.sparse_index = [v.id for v in registros[::BLOCK_SIZE]] if self.has_id else []
+        return registros
 
     def reorganize(self):
-        registros = [v for v in self._read_all(self.data_file) if not v.eliminado]
-        registros += list(self._read_all(self.aux_file))
-        registros.sort(key=lambda v: v.id)
-
-        with open(self.data_file, "wb") as f:
-            for v in registros:
-                f.write(v.to_bytes())
-
+        """Mezcla el auxiliar con el principal sin cargar la tabla en memoria.
+
+        Solo el auxiliar (pequeño) se ordena en memoria; el principal ya está
+        ordenado, así que basta una mezcla en streaming hacia un archivo
+        temporal que luego reemplaza al original. Los registros se copian como
+        bytes: únicamente se lee el campo id para comparar.
+
+        Devuelve {localizador viejo: slot nuevo} de los registros que se
+        movieron y se lo pasa a reorganize_listeners.
+        """
+        buffer_pool.count(
+            self.owner,
+            reads=count_pages(os.path.getsize(self.data_file))
+            + count_pages(os.path.getsize(self.aux_file)),
+        )
+        with open(self.aux_file, "rb") as f:
+            aux_run = list(self._iter_live_raw(f, AUX_LOCATOR))
+        if self.has_id:
+            aux_run.sort(key=lambda kv: kv[0])
+
+        tmp_file = self.data_file + ".tmp"
+        sparse_index = []
+        moves = {}  # localizador viejo -> slot nuevo (solo los que cambian)
+        with open(self.data_file, "rb", buffering=1 << 20) as src, open(
+            tmp_file, "wb", buffering=1 << 20
+        ) as dst:
+            if self.has_id:
+                merged = heapq.merge(self._iter_live_raw(src), aux_run, key=lambda kv: kv[0])
+            else:
+                # Sin id no hay orden que mantener: el auxiliar va al final
+                merged = itertools.chain(self._iter_live_raw(src), aux_run)
+            for pos, (key, chunk, locator) in enumerate(merged):
+                if self.has_id and pos % BLOCK_SIZE == 0:
+                    sparse_index.append(key)
+                if locator != pos:
+                    moves[locator] = pos
+                dst.write(chunk)
+            written = dst.tell()
+
+        os.replace(tmp_file, self.data_file)
         open(self.aux_file, "wb").close()
+        self.data_map.rewritten(written)
+        self.aux_map.invalidate()
+        self.aux_index = {}
+        self._reset_free_slots()
+        self.sparse_index = sparse_index
+        self.stats["reorganizations"] += 1
+        self.stats["bytes_rewritten"] += written
+        for listener in self.reorganize_listeners.values():
+            listener(moves)
+        return moves
 
     def search(self, id):
-        for file in [self.data_file, self.aux_file]:
-            with open(file, "rb") as f:
-                while True:
-                    chunk = f.read(self.record_size)
-                    if len(chunk) < self.record_size:
-                        break
-                    producto = self.ProductoClass.from_bytes(chunk)
-                    if not producto.eliminado and producto.id == id:
-                        return producto
-        return None
+        _, producto = self._search_data_file(id)
+        if producto is not None and not producto.eliminado:
+            return producto
 
-    def delete(self, id):
-        for file in [self.data_file, self.aux_file]:
-            productos = self._read_all(file)
-            modified = False
-            for i, producto in enumerate(productos):
-                if not producto.eliminado and producto.id == id:
-                    productos[i].eliminado = True
-                    modified = True
-                    break
-            if modified:
-                with open(file, "wb") as f:
-                    for v in productos:
-                        f.write(v.to_bytes())
-                return True
-        return False
+        _, producto = self._search_aux_file(id)
+        return producto
 
+    def delete(self, id):
+        """Borrado lógico en el lugar: solo se sobrescribe el byte de eliminado.
+
+        No mueve ningún registro, así que los localizadores guardados por los
+        índices siguen siendo válidos; solo reorganize los mueve, y avisa a
+        reorganize_listeners cuáles cambiaron.
+        """
+        slot, producto = self._search_data_file(id)
+        if producto is not None and not producto.eliminado:
+            pages, kind = self.data_map, "data"
+        else:
+            slot, producto = self._search_aux_file(id)
+            if producto is None:
+                return False
+            pages, kind = self.aux_map, "aux"
+            del self.aux_index[id]
+
+        pages.write(slot * self.record_size + self.record_size - 1, DELETED_FLAG)
+
+        self.free_slots[kind].append(slot)
+        self._save_free_slots()
+        return True
+
+    def locate(self, id):
+        """Localizador del registro vivo con ese id (None si no existe)."""
+        slot, producto = self._search_data_file(id)
+        if producto is not None and not producto.eliminado:
+            return slot
+        slot = self.aux_index.get(id)
+        return None if slot is None else AUX_LOCATOR | slot
+
+    def fetch_locators(self, locators):
+        """Registros vivos de una lista de localizadores, leídos en orden de offset.
+
+        Los localizadores se ordenan y los slots consecutivos se leen con una
+        sola lectura, así un rango de un índice secundario se resuelve con una
+        pasada hacia adelante por el archivo en vez de una búsqueda por id.
+        locators puede ser un iterador (el cursor de un índice): se recorre una
+        sola vez.
+        """
+        result = []
+        rs = self.record_size
+        data, aux = [], []
+        for loc in locators:
+            if loc & AUX_LOCATOR:
+                aux.append(loc & ~AUX_LOCATOR)
+            else:
+                data.append(loc)
+        data.sort()
+        aux.sort()
+        for pages, slots in ((self.data_map, data), (self.aux_map, aux)):
+            i = 0
+            while i < len(slots):
+                j = i + 1
+                while j < len(slots) and slots[j] <= slots[j - 1] + 1:
+                    j += 1
+                start, stop = slots[i], slots[j - 1] + 1
+                block = pages.read(start * rs, (stop - start) * rs)
+                if block is not None:
+                    for slot in dict.fromkeys(slots[i:j]):
+                        chunk = block[(slot - start) * rs : (slot - start + 1) * rs]
+                        if not chunk[-1]:
+                            result.append(self.ProductoClass.from_bytes(chunk))
+                i = j
+        return result
 
     def range_search(self, id_inicio, id_fin):
+        """Registros con id_inicio <= id <= id_fin, ordenados por id.
+
+        En el archivo principal se empieza en el bloque del índice disperso y
+        se compara solo el id leído de los bytes; se decodifican únicamente los
+        registros del rango.
+        """
         result = []
-        for file in [self.data_file, self.aux_file]:
-            with open(file, "rb") as f:
-                while chunk := f.read(self.record_size):
-                    producto = self.ProductoClass.from_bytes(chunk)
-                    if not producto.eliminado and id_inicio <= producto.id <= id_fin:
-                        result.append(producto)
+        start = max(bisect_right(self.sparse_index, id_inicio) - 1, 0) * BLOCK_SIZE
+        for slot in range(start, len(self.data_map)):
+            chunk = self.data_map.record(slot)
+            key = self._key_from_bytes(chunk)
+            if key > id_fin:
+                break
+            if key >= id_inicio and not chunk[-1]:
+                result.append(self.ProductoClass.from_bytes(chunk))
+
+        for key, slot in self.aux_index.items():
+            if id_inicio <= key <= id_fin:
+                result.append(self.ProductoClass.from_bytes(self.aux_map.record(slot)))
         return sorted(result, key=lambda v: v.id)
 
 
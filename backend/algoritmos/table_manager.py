@@ -1,8 +1,9 @@
 import os
 import json
-from algoritmos.bplus_tree import BPlusTree
 from algoritmos.sequential import SequentialFileManager, build_producto_class
 from algoritmos.rtree_in import RTreeIndex, build_city_class
+from algoritmos.secondary_indexes import open_index, register_index, table_indexes
+from algoritmos.wal import WriteAheadLog
 
 tables_dir = "tables"
 os.makedirs(tables_dir, exist_ok=True)
@@ -71,15 +72,39 @@ def load_all_tables():
                     "table_name": table_name,
                 }
 
-                index_info = meta.get("index")
-                if index_info and index_info.get("type") == "bplustree":
-                    col = index_info["column"]
-                    index_path = os.path.join(
-                        tables_dir, f"index_bplustree_{table_name}_{col}.dat"
-                    )
-                    if os.path.exists(index_path):
-                        bplus_tree = BPlusTree.load_from_file(index_path)
-                        global_tables[table_name]["bplus_tree"] = bplus_tree
+                # Índice de CREATE TABLE y los de CREATE INDEX
+                for index in table_indexes(meta):
+                    structure = open_index(table_name, index, manager)
+                    if structure is None:
+                        continue
+                    register_index(global_tables[table_name], index, structure)
+                    if index["name"] == index["column"]:
+                        # Compatibilidad: el índice de CREATE TABLE en su entrada de siempre
+                        slot = "bplus_tree" if index["type"] == "bplustree" else index["type"]
+                        global_tables[table_name].setdefault(slot, structure)
+                attach_wal(table_name)
+
+
+def attach_wal(table_name, replay=True):
+    """Abre el WAL de una tabla sequential y registra sus índices en él.
+
+    Con replay reaplica los cambios que quedaron sin checkpoint (arranque);
+    sin replay descarta el log (la tabla se acaba de construir desde cero).
+    """
+    table_info = global_tables[table_name]
+    manager = table_info["manager"]
+    wal = WriteAheadLog(os.path.join(tables_dir, f"{table_name}.wal"), owner=f"{table_name}.wal")
+    for index in table_info.get("indexes", {}).values():
+        wal.indexes[index["file"]] = index["structure"]
+    if replay:
+        wal.replay()
+    else:
+        wal.checkpoint()
+    # Después de los listeners de los índices: los localizadores del log
+    # anteriores al reorganize ya no sirven
+    manager.reorganize_listeners[wal.path] = wal.checkpoint
+    table_info["wal"] = wal
+    return wal
 
 
 def limpiar_precio(valor):
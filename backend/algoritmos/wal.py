@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+
+from algoritmos.buffer_pool import buffer_pool, count_pages
+
+# Registros entre checkpoints: al llegar a este número los índices se escriben
+# a disco y el log se vacía
+DEFAULT_CHECKPOINT_RECORDS = int(os.environ.get("WAL_CHECKPOINT_RECORDS", 1000))
+# Espera opcional del líder antes de escribir, para juntar más registros por fsync
+DEFAULT_GROUP_WINDOW = float(os.environ.get("WAL_GROUP_COMMIT_MS", 0)) / 1000
+
+
+class WriteAheadLog:
+    """Log append-only de las modificaciones a los índices de una tabla.
+
+    Cada INSERT/DELETE aplica el cambio al índice en memoria y lo registra
+    aquí; log() vuelve cuando el registro ya está en disco. Los registros que
+    llegan mientras otro hilo hace fsync se escriben juntos en la siguiente
+    tanda (group commit). Los índices solo se persisten en los checkpoints;
+    si el proceso cae antes, replay() reaplica el log sobre el último estado
+    guardado.
+
+    Cubre todos los índices de la tabla (bplustree, isam y hash). Ninguno
+    escribe sus cambios antes del flush: el B+ tree paginado no escribe nodos
+    modificados al desalojarlos del caché, el ISAM guarda en memoria las
+    páginas que cambió y el hash los buckets, así que entre checkpoints los
+    archivos de los índices no cambian y el log se reaplica sobre el estado
+    del último checkpoint. Los archivos de datos de la tabla no pasan por el
+    log: cada INSERT/DELETE escribe su registro en el momento. Si
+    la caída ocurre después de guardar los índices y antes de vaciar el log,
+    se reaplican cambios que ya están en disco; por eso la reaplicación es
+    idempotente: cada "add" primero quita el par (clave, valor).
+    """
+
+    def __init__(
+        self,
+        path,
+        owner=None,
+        checkpoint_every=DEFAULT_CHECKPOINT_RECORDS,
+        group_window=DEFAULT_GROUP_WINDOW,
+    ):
+        self.path = path
+        self.owner = owner or os.path.basename(path)
+        self.checkpoint_every = max(int(checkpoint_every), 1)
+        self.group_window = group_window
+        # nombre del índice (su archivo) -> índice con add/remove/save_to_file
+        self.indexes = {}
+        self.stats = {"records": 0, "flushes": 0, "checkpoints": 0}
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._next_lsn = 0  # último número de secuencia asignado
+        self._durable_lsn = 0  # último número de secuencia ya en disco
+        self._flushing = False
+        self._since_checkpoint = 0
+        if not os.path.exists(path):
+            open(path, "wb").close()
+
+    def log(self, op, index, key, value):
+        """Registra op ("add" / "remove") sobre index y espera a que esté en disco."""
+        line = json.dumps([op, index, key, value]) + "\n"
+        with self._cond:
+            self._buffer.append(line)
+            self._next_lsn += 1
+            lsn = self._next_lsn
+            while self._durable_lsn < lsn:
+                if self._flushing:
+                    self._cond.wait()
+                else:
+                    self._flush_batch()
+            self._since_checkpoint += 1
+            if self._since_checkpoint >= self.checkpoint_every:
+                self._checkpoint_locked()
+
+    def _flush_batch(self):
+        """Escribe y sincroniza todo lo pendiente; se llama con _cond tomado."""
+        self._flushing = True
+        self._cond.release()
+        try:
+            if self.group_window:
+                time.sleep(self.group_window)
+        finally:
+            self._cond.acquire()
+        batch, self._buffer = self._buffer, []
+        upto = self._next_lsn
+        self._cond.release()
+        try:
+            data = "".join(batch).encode("utf-8")
+            with open(self.path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            buffer_pool.count(self.owner, writes=count_pages(len(data)))
+        finally:
+            self._cond.acquire()
+            self._flushing = False
+            self._durable_lsn = upto
+            self.stats["records"] += len(batch)
+            self.stats["flushes"] += 1
+            self._cond.notify_all()
+
+    def checkpoint(self, moves=None):
+        """Persiste los índices y vacía el log (sirve como listener de reorganize)."""
+        with self._cond:
+            self._checkpoint_locked()
+
+    def _checkpoint_locked(self):
+        # Los registros de una tanda en curso ya están aplicados en los índices
+        while self._flushing:
+            self._cond.wait()
+        for name, index in self.indexes.items():
+            index.save_to_file(name)
+        with open(self.path, "wb") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._since_checkpoint = 0
+        self.stats["checkpoints"] += 1
+
+    def records(self):
+        """Registros del log en orden; ignora una última línea incompleta."""
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return  # escritura cortada por una caída
+
+    def replay(self):
+        """Reaplica el log sobre los índices registrados y hace checkpoint."""
+        applied = 0
+        for op, name, key, value in self.records():
+            index = self.indexes.get(name)
+            if index is None:
+                continue
+            index.remove(key, value)
+            if op == "add":
+                index.add(key, value)
+            applied += 1
+        self.checkpoint()
+        return applied